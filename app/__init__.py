@@ -2,7 +2,11 @@ from flask import Flask
 from .config import config_by_name
 from .extensions import db, migrate, login_manager
 from datetime import datetime
-from .models import Completion
+from .models import Habit
+from . import events  # noqa: F401 registers the ORM event listeners
+from .cli import habits_cli, analytics_cli, reminders_cli
+from .cache import analytics_cache
+from .pagination import page_url
 import logging
 
 from .routes.auth import auth_bp
@@ -23,6 +27,7 @@ def create_app(config_name='default'):
     flask_app = Flask(__name__)
     # Load the configuration from the config dictionary
     flask_app.config.from_object(config_by_name[config_name])
+    flask_app.config['CONFIG_NAME'] = config_name
     # Update additional Flask configurations
     flask_app.config.update(
         SERVER_NAME='127.0.0.1:5000',
@@ -34,6 +39,7 @@ def create_app(config_name='default'):
     db.init_app(flask_app)
     migrate.init_app(flask_app, db)
     login_manager.init_app(flask_app)
+    analytics_cache.init_app(flask_app)
     flask_app.logger.setLevel(logging.INFO)
     # Set the logging level to INFO
 
@@ -44,6 +50,11 @@ def create_app(config_name='default'):
     flask_app.register_blueprint(reminder_bp, url_prefix='/reminders')
     flask_app.register_blueprint(analytics_bp, url_prefix='/analytics')
 
+    # Register CLI commands
+    flask_app.cli.add_command(habits_cli)
+    flask_app.cli.add_command(analytics_cli)
+    flask_app.cli.add_command(reminders_cli)
+
     # Register a context processor function that will return the current date and time.
     @flask_app.context_processor
     def inject_datetime():
@@ -54,9 +65,11 @@ def create_app(config_name='default'):
     @flask_app.context_processor
     def utility_processor():
         def get_completions_count(habit_id):
-            return Completion.query.filter_by(habit_id=habit_id).count()
+            # Habits already loaded by the view come from the identity map without a query.
+            habit = db.session.get(Habit, habit_id)
+            return habit.completed_count or 0 if habit is not None else 0
 
-        return dict(get_completions_count=get_completions_count)
+        return dict(get_completions_count=get_completions_count, page_url=page_url)
 
     return flask_app
     # Return the created Flask application object.
@@ -0,0 +1,50 @@
+from typing import Iterable, List
+
+# Helpers for completion bitmaps: one bit per habit period, bit 0 being the first period of the bitmap.
+# Bitmaps are stored as little-endian bytes and handled as Python integers, so setting, shifting,
+# slicing and counting bits run as single big-integer operations.
+
+
+def _to_int(bitmap: bytes) -> int:
+    return int.from_bytes(bitmap or b'', 'little')
+
+
+def _to_bytes(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def from_indexes(indexes: Iterable[int]) -> bytes:
+    # Builds a bitmap with the given bits set.
+    value = 0
+    for index in indexes:
+        value |= 1 << index
+    return _to_bytes(value)
+
+
+def set_bit(bitmap: bytes, index: int) -> bytes:
+    return _to_bytes(_to_int(bitmap) | (1 << index))
+
+
+def shift(bitmap: bytes, count: int) -> bytes:
+    # Prepends count unset bits, moving the origin of the bitmap count periods back.
+    return _to_bytes(_to_int(bitmap) << count)
+
+
+def slice_bits(bitmap: bytes, start: int, stop: int) -> List[bool]:
+    # Returns the bits from start (inclusive) to stop (exclusive); bits before the origin are unset.
+    value = _to_int(bitmap)
+    padding = max(0, -start)
+    start = max(start, 0)
+    if stop <= start:
+        return [False] * max(0, stop - start + padding)
+    window = value >> start & ((1 << (stop - start)) - 1)
+    return [False] * padding + [bool(window >> offset & 1) for offset in range(stop - start)]
+
+
+def popcount(bitmap: bytes) -> int:
+    return bin(_to_int(bitmap)).count('1')
+
+
+def longest_run(bitmap: bytes) -> int:
+    # Length of the longest run of set bits.
+    return max(map(len, bin(_to_int(bitmap))[2:].split('0')), default=0)
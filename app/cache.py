@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+from types import MappingProxyType
+
+from .extensions import db
+from .models import User
+
+
+class AnalyticsCache:
+    # Bounded in-process LRU cache for analytics results.
+    # Entries are keyed by user and the user's data version, which is stored in the database and bumped
+    # on every write, so each gunicorn worker can keep its own cache without ever serving stale results.
+    # Entries of outdated versions are never hit again and age out through LRU eviction.
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_size = app.config.get('ANALYTICS_CACHE_SIZE', self.max_size)
+        self.clear()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'max_size': self.max_size}
+
+
+analytics_cache = AnalyticsCache()
+
+
+def data_version(user_id: int) -> int:
+    # Returns the current data version of a user. The logged-in user is already in the identity map,
+    # so this usually costs no query.
+    user = db.session.get(User, user_id)
+    return user.data_version if user is not None and user.data_version is not None else 0
+
+
+def freeze(value):
+    # Returns a read-only version of a cached value: lists become tuples and dicts read-only mappings,
+    # so callers cannot modify a value shared between requests.
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    return value
+
+
+def cached_per_user(func):
+    # Caches the result of a function taking the user id as its first argument. All other arguments,
+    # positional and keyword, are part of the key and must be hashable. Results are stored frozen.
+    @wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        key = (func.__qualname__, user_id, data_version(user_id)) + args + tuple(sorted(kwargs.items()))
+        return analytics_cache.get_or_compute(key, lambda: freeze(func(user_id, *args, **kwargs)))
+
+    return wrapper
@@ -0,0 +1,90 @@
+from typing import Optional
+
+from sqlalchemy import select
+
+from .extensions import db
+from .models import User, Habit, Completion, Reminder, Tombstone
+
+# Change feed for clients mirroring a user's data.
+# Every change of a habit, completion or reminder stamps the row with the user's new data version, and
+# deletions leave tombstones stamped the same way (see events.py). A client keeps the data version of its
+# last refresh as cursor and fetches the rows stamped after it, so a refresh reads only what changed.
+# The versions are handed out under a lock on the user's row, so once a version is committed, no
+# transaction can still commit a smaller one, and the feed never skips a change.
+
+
+def _habit(habit: Habit) -> dict:
+    return {
+        'id': habit.id,
+        'name': habit.name,
+        'description': habit.description,
+        'periodicity': habit.periodicity,
+        'created_at': habit.created_at.isoformat() if habit.created_at else None,
+        'completed': habit.completed,
+        'completed_count': habit.completed_count,
+        'streak': habit.current_streak,
+        'longest_streak': habit.longest_streak,
+        'last_completed': habit.last_completed.isoformat() if habit.last_completed else None
+    }
+
+
+def _completion(completion: Completion) -> dict:
+    return {
+        'id': completion.id,
+        'habit_id': completion.habit_id,
+        'day': completion.day.isoformat(),
+        'completed_at': completion.completed_at.isoformat() if completion.completed_at else None,
+        'count': completion.count
+    }
+
+
+def _reminder(reminder: Reminder) -> dict:
+    return {
+        'id': reminder.id,
+        'habit_id': reminder.habit_id,
+        'message': reminder.message,
+        'date': reminder.date.isoformat() if reminder.date else None,
+        'recurrence': reminder.recurrence,
+        'weekdays': reminder.weekdays,
+        'interval_days': reminder.interval_days,
+        'until': reminder.until.isoformat() if reminder.until else None
+    }
+
+
+def changes_since(user_id: int, cursor: Optional[int]) -> dict:
+    # Returns the user's habits, completions and reminders changed after the cursor, the deleted ones as
+    # tombstones, and the cursor of the next refresh. Without a cursor, all rows are returned.
+    # Raises ValueError for a cursor ahead of the user's data version.
+    version = db.session.execute(select(User.data_version).where(User.id == user_id)).scalar_one()
+    if cursor is not None and not 0 <= cursor <= version:
+        raise ValueError('Invalid cursor')
+
+    # Rows stamped after the version read above belong to the next refresh.
+    def window(column):
+        return [column <= version] if cursor is None else [column > cursor, column <= version]
+
+    habits = db.session.execute(
+        select(Habit).where(Habit.user_id == user_id, *window(Habit.change_seq)).order_by(Habit.id)
+    ).scalars()
+    completions = db.session.execute(
+        select(Completion).join(Habit, Completion.habit_id == Habit.id)
+        .where(Habit.user_id == user_id, *window(Completion.change_seq)).order_by(Completion.id)
+    ).scalars()
+    reminders = db.session.execute(
+        select(Reminder).join(Habit, Reminder.habit_id == Habit.id)
+        .where(Habit.user_id == user_id, *window(Reminder.change_seq)).order_by(Reminder.id)
+    ).scalars()
+    deleted = []
+    if cursor is not None:
+        deleted = db.session.execute(
+            select(Tombstone.entity, Tombstone.entity_id)
+            .where(Tombstone.user_id == user_id, *window(Tombstone.change_seq)).order_by(Tombstone.id)
+        ).all()
+
+    return {
+        'cursor': version,
+        'habits': [_habit(habit) for habit in habits],
+        'completions': [_completion(completion) for completion in completions],
+        'reminders': [_reminder(reminder) for reminder in reminders],
+        'deleted': [{'type': entity, 'id': entity_id} for entity, entity_id in deleted]
+    }
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from .extensions import db
+from .models import Habit, Completion
+from .rollup import rebuild_completion_days
+from .precompute import precompute_stats
+from .rollover import rollover_completed
+from .dispatcher import SINKS, Dispatcher
+
+# Command group for habit maintenance tasks, available as `flask habits <command>`.
+habits_cli = AppGroup('habits', help='Maintenance commands for habits.')
+
+# Command group for analytics jobs, available as `flask analytics <command>`.
+analytics_cli = AppGroup('analytics', help='Analytics batch jobs.')
+
+# Command group for reminder delivery, available as `flask reminders <command>`.
+reminders_cli = AppGroup('reminders', help='Reminder delivery.')
+
+
+@habits_cli.command('repair-stats')
+@click.option('--user-id', type=int, default=None, help='Only repair the habits of this user.')
+def repair_stats(user_id):
+    # Rebuilds the maintained stats columns (streak, longest streak, last completed day and
+    # completion count) and the daily completion rollup of every habit from the raw completions.
+    query = Habit.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    habits = query.all()
+
+    days_by_habit = {habit.id: [] for habit in habits}
+    rows = db.session.execute(
+        select(Completion.habit_id, Completion.day).where(Completion.habit_id.in_(days_by_habit))
+    )
+    for habit_id, day in rows:
+        days_by_habit[habit_id].append(day)
+
+    for habit in habits:
+        days = days_by_habit[habit.id]
+        habit.rebuild_stats(days)
+        habit.completed_count = len(days)
+    rebuild_completion_days(db.session.connection(), list(days_by_habit))
+    db.session.commit()
+    click.echo('Rebuilt stats for {} habits.'.format(len(habits)))
+
+
+@habits_cli.command('rollover')
+def rollover():
+    # Resets the completed flag of daily habits after a day and of weekly habits after their week.
+    # Run it after midnight, e.g. from cron: `5 0 * * * flask habits rollover`.
+    started = time.monotonic()
+    touched = rollover_completed(report=click.echo)
+    db.session.commit()
+    click.echo('Rolled over {} habits in {:.3f}s.'.format(sum(touched.values()), time.monotonic() - started))
+
+
+@analytics_cli.command('precompute')
+@click.option('--workers', type=int, default=1, show_default=True, help='Number of worker processes.')
+@click.option('--chunk-size', type=int, default=500, show_default=True, help='Number of users per chunk.')
+@click.option('--resume/--restart', default=True, show_default=True,
+              help='Continue after the last completed chunk of an interrupted run, or start over.')
+def precompute(workers, chunk_size, resume):
+    # Precomputes streaks, completion counts and completion rates of all users into the habit_stat table.
+    processed = precompute_stats(current_app._get_current_object(), workers=max(workers, 1),
+                                 chunk_size=max(chunk_size, 1), resume=resume, report=click.echo)
+    click.echo('Precomputed stats for {} users.'.format(processed))
+
+
+@reminders_cli.command('dispatch')
+@click.option('--sink', type=click.Choice(sorted(SINKS)), default='log', show_default=True,
+              help='Where reminders are delivered to.')
+@click.option('--target', default=None,
+              help='host:port of the SMTP server, URL of the webhook or path of the log file.')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Number of reminders per tick.')
+@click.option('--interval', type=float, default=60.0, show_default=True, help='Seconds between ticks.')
+@click.option('--lookback-days', type=int, default=1, show_default=True,
+              help='Also deliver missed occurrences of this many past days.')
+@click.option('--once', is_flag=True, help='Deliver all due reminders and exit instead of running forever.')
+def dispatch(sink, target, batch_size, interval, lookback_days, once):
+    # Delivers due reminders through the chosen sink, e.g. as a service: `flask reminders dispatch --sink smtp`.
+    dispatcher = Dispatcher(SINKS[sink](target), batch_size=max(batch_size, 1), lookback_days=max(lookback_days, 0),
+                            report=click.echo)
+    try:
+        asyncio.run(dispatcher.run(interval=interval, once=once))
+    except KeyboardInterrupt:
+        pass
+    metrics = dispatcher.metrics.snapshot()
+    click.echo('Dispatched {} reminders in {} ticks, {} failed ({:.1f}/s, max lag {:.0f}s).'.format(
+        metrics['dispatched'], metrics['ticks'], metrics['failed'], metrics['throughput'], metrics['max_lag']))
@@ -0,0 +1,188 @@
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select, insert, update, bindparam, tuple_, func
+from sqlalchemy.dialects import sqlite, postgresql
+
+from .extensions import db
+from .models import Habit, Completion, DailyCompletion
+from .rollup import add_completion_days
+from .events import adjust_completed_count, next_change_seq
+
+# Writing of completions with upsert statements on the unique (habit_id, day) key of the completion table.
+# Bulk items are validated in Python, ownership is checked with one query and the new completions are written
+# with executemany INSERT ... ON CONFLICT DO NOTHING in the session's transaction, so repeating a request
+# never duplicates completions. Core statements bypass the ORM events, so the counters, stats, rollup and
+# change sequence they maintain are updated here.
+
+daily_completion = DailyCompletion.__table__
+completion_table = Completion.__table__
+
+
+def parse_habit_id(value) -> int:
+    # Returns a submitted habit id. Raises ValueError unless it is an integer; booleans and floats are rejected.
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError('Invalid habit id')
+    return value
+
+
+def owned_habits(user_id: int, habit_ids: Iterable[int]) -> Dict[int, Optional[date]]:
+    # Returns the day of creation of the given habits that belong to the user, keyed by habit id, with one query.
+    # Completions before the creation of a habit are rejected, so they cannot stretch its bitmap.
+    habit_ids = set(habit_ids)
+    if not habit_ids:
+        return {}
+    rows = db.session.execute(
+        select(Habit.id, Habit.created_at).where(Habit.user_id == user_id, Habit.id.in_(habit_ids)))
+    return {habit_id: created_at.date() if created_at is not None else None for habit_id, created_at in rows}
+
+
+def before_creation(created: Optional[date], day: date) -> bool:
+    return created is not None and day < created
+
+
+def parse_items(items) -> Tuple[List[dict], List[Tuple[int, int, date]]]:
+    # Validates the submitted {'habit_id', 'date'} items. Returns a result per item, with a status
+    # for the invalid ones, and the (index, habit_id, day) tuples of the valid ones.
+    today = date.today()
+    results, valid = [], []
+    for index, item in enumerate(items):
+        result = {'index': index}
+        results.append(result)
+        if not isinstance(item, dict):
+            result.update(status='invalid', error='Items must be objects with habit_id and date')
+            continue
+        result.update(habit_id=item.get('habit_id'), date=item.get('date'))
+        try:
+            habit_id = parse_habit_id(item['habit_id'])
+            day = date.fromisoformat(str(item['date']))
+        except (KeyError, TypeError, ValueError):
+            result.update(status='invalid', error='habit_id must be an integer and date use the YYYY-MM-DD format')
+            continue
+        if day > today:
+            result.update(status='invalid', error='Completions cannot lie in the future')
+            continue
+        valid.append((index, habit_id, day))
+    return results, valid
+
+
+def _claim_days(connection, pairs: Sequence[Tuple[int, date]], seq: int) -> Set[Tuple[int, date]]:
+    # Inserts a completion stamped with the change sequence seq for each (habit_id, day) pair unless the habit
+    # is already completed that day, and returns the pairs that were inserted. The daily rollup is updated for them.
+    rows = [{'habit_id': habit_id, 'completed_at': day, 'day': day, 'count': 1, 'change_seq': seq}
+            for habit_id, day in pairs]
+    dialect = connection.dialect
+    if dialect.name in ('sqlite', 'postgresql') and dialect.insert_executemany_returning:
+        module = sqlite if dialect.name == 'sqlite' else postgresql
+        stmt = module.insert(completion_table).on_conflict_do_nothing(
+            index_elements=[completion_table.c.habit_id, completion_table.c.day]
+        ).returning(completion_table.c.habit_id, completion_table.c.day)
+        claimed = {(habit_id, day) for habit_id, day in connection.execute(stmt, rows)}
+    else:
+        # Without an insert returning the added rows, existing days are looked up first.
+        existing = set(connection.execute(
+            select(completion_table.c.habit_id, completion_table.c.day).where(
+                tuple_(completion_table.c.habit_id, completion_table.c.day).in_(list(pairs)))
+        ).all())
+        rows = [row for row in rows if (row['habit_id'], row['day']) not in existing]
+        if rows:
+            connection.execute(insert(completion_table), rows)
+        claimed = {(row['habit_id'], row['day']) for row in rows}
+
+    add_completion_days(connection, [{'habit_id': habit_id, 'day': day, 'count': 1} for habit_id, day in claimed])
+    return claimed
+
+
+def refresh_habits(connection, claimed: Iterable[Tuple[int, date]]):
+    # Updates completion counts, stats columns and bitmaps of the habits that got new completions.
+    added = {}
+    for habit_id, _ in claimed:
+        added[habit_id] = added.get(habit_id, 0) + 1
+    connection.execute(
+        update(Habit.__table__).where(Habit.__table__.c.id == bindparam('b_id')).values(
+            completed_count=func.coalesce(Habit.__table__.c.completed_count, 0) + bindparam('b_added')),
+        [{'b_id': habit_id, 'b_added': count} for habit_id, count in added.items()]
+    )
+
+    days_by_habit = {habit_id: [] for habit_id in added}
+    for habit_id, day in connection.execute(
+            select(DailyCompletion.habit_id, DailyCompletion.day).where(DailyCompletion.habit_id.in_(added))):
+        days_by_habit[habit_id].append(day)
+    # Changing the habits also bumps the data version of their owner when the session is flushed.
+    for habit in Habit.query.filter(Habit.id.in_(added)):
+        habit.rebuild_stats(days_by_habit[habit.id])
+        db.session.expire(habit, ['completed_count'])
+
+
+def _upsert_completion(connection, habit_id: int, day: date, seq: int) -> bool:
+    # Inserts the completion of a habit on a day, or increments the count of the existing one, stamping it
+    # with the change sequence seq. Returns True if a new completion was inserted.
+    row = {'habit_id': habit_id, 'completed_at': datetime.now(), 'day': day, 'count': 1, 'change_seq': seq}
+    dialect_name = connection.dialect.name
+    if dialect_name in ('sqlite', 'postgresql'):
+        module = sqlite if dialect_name == 'sqlite' else postgresql
+        stmt = module.insert(completion_table).values(**row).on_conflict_do_update(
+            index_elements=[completion_table.c.habit_id, completion_table.c.day],
+            set_={'count': func.coalesce(completion_table.c.count, 1) + 1, 'change_seq': seq}
+        ).returning(completion_table.c.count)
+        return connection.execute(stmt).scalar_one() == 1
+
+    result = connection.execute(
+        update(completion_table)
+        .where(completion_table.c.habit_id == habit_id, completion_table.c.day == day)
+        .values(count=func.coalesce(completion_table.c.count, 1) + 1, change_seq=seq)
+    )
+    if result.rowcount:
+        return False
+    connection.execute(insert(completion_table).values(**row))
+    return True
+
+
+def complete_habit(habit: Habit, day: date) -> bool:
+    # Records a completion of the habit on the day. Completing a day again increments the count of its
+    # completion instead of adding a row. Returns True if the day was not completed before.
+    # The caller commits the session.
+    # The completion changes even if the habit does not, so the data version is bumped explicitly.
+    seq = next_change_seq(db.session, habit.user_id)
+    connection = db.session.connection()
+    created = _upsert_completion(connection, habit.id, day, seq)
+    add_completion_days(connection, [{'habit_id': habit.id, 'day': day, 'count': 1}])
+    if created:
+        adjust_completed_count(connection, habit.id, 1)
+        db.session.expire(habit, ['completed_count'])
+        if not habit.record_completion(day):
+            days = db.session.execute(
+                select(DailyCompletion.day).where(DailyCompletion.habit_id == habit.id)).scalars().all()
+            habit.rebuild_stats(days)
+    return created
+
+
+def bulk_complete(user_id: int, items) -> List[dict]:
+    # Records the completions of the given items for habits of the user and returns a result per item:
+    # 'created', 'exists' (the habit was already completed that day), 'not_found' or 'invalid'.
+    # The caller commits the session.
+    results, valid = parse_items(items)
+    owned = owned_habits(user_id, (habit_id for _, habit_id, _ in valid))
+
+    pairs = {}
+    for index, habit_id, day in valid:
+        if habit_id not in owned:
+            results[index].update(status='not_found', error='No such habit')
+        elif before_creation(owned[habit_id], day):
+            results[index].update(status='invalid', error='Completions cannot lie before the creation of the habit')
+        else:
+            pairs.setdefault((habit_id, day), index)
+
+    claimed = set()
+    if pairs:
+        connection = db.session.connection()
+        claimed = _claim_days(connection, list(pairs), next_change_seq(db.session, user_id))
+    if claimed:
+        refresh_habits(connection, claimed)
+
+    # Repeated pairs of a request report 'created' for their first occurrence only.
+    for index, habit_id, day in valid:
+        if 'status' not in results[index]:
+            created = (habit_id, day) in claimed and pairs[(habit_id, day)] == index
+            results[index]['status'] = 'created' if created else 'exists'
+    return results
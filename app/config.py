@@ -12,6 +12,22 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Maximum number of analytics results kept in the per-worker LRU cache.
+    ANALYTICS_CACHE_SIZE = 1024
+    # Maximum age in seconds of precomputed habit stats before the analytics pages compute them live.
+    ANALYTICS_STATS_MAX_AGE = 26 * 60 * 60
+    # Maximum number of completions accepted by one bulk completion request.
+    BULK_COMPLETIONS_MAX_ITEMS = 10000
+    # Maximum number of days covered by one completion time series request.
+    TIMESERIES_MAX_DAYS = 3 * 366
+    # Default and maximum number of rows per page of the habit, reminder and completion lists.
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+    # Number of completions removed per DELETE statement when a habit with a long history is deleted.
+    # All statements of a deletion run in one transaction, which on SQLite holds the write lock throughout.
+    DELETE_CHUNK_SIZE = 5000
+    # Seconds browsers and shared caches may keep the landing page of anonymous visitors.
+    LANDING_PAGE_MAX_AGE = 300
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,53 @@
+from typing import Iterable, List
+
+from sqlalchemy import select, insert, delete
+
+from .extensions import db
+from .models import Habit, Completion, Reminder, DailyCompletion, HabitStat, Tombstone
+from .events import next_change_seq
+
+# Set-based deletion of habits with everything that belongs to them.
+# Children are removed with DELETE ... WHERE habit_id IN (...) statements instead of loading them through
+# the relationships. Bulk statements bypass the ORM events, so the owners' data version is bumped and the
+# tombstones of the habits are written here.
+
+
+def delete_completions_in_chunks(habit_ids: List[int], chunk_size: int) -> int:
+    # Deletes the completions of the habits chunk_size rows at a time and returns their number.
+    # Chunks keep every statement and its IN list small. They all run in the caller's transaction, so the
+    # habits, their histories and their tombstones are deleted together or not at all; the completions
+    # reference their habit, so they cannot outlive it to be purged later.
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(Completion.id).where(Completion.habit_id.in_(habit_ids)).limit(chunk_size)
+        ).scalars().all()
+        if ids:
+            db.session.execute(delete(Completion).where(Completion.id.in_(ids)),
+                               execution_options={'synchronize_session': False})
+            deleted += len(ids)
+        if len(ids) < chunk_size:
+            return deleted
+
+
+def delete_habits(user_id: int, habit_ids: Iterable[int], chunk_size: int = 5000) -> List[int]:
+    # Deletes the given habits of the user together with their completions, reminders, daily rollup
+    # and precomputed stats, and returns the ids of the deleted habits. Ids of other users' habits are
+    # ignored. Histories are deleted chunk_size completions at a time. Everything is deleted in the
+    # caller's transaction, which the caller commits.
+    owned = db.session.execute(
+        select(Habit.id).where(Habit.user_id == user_id, Habit.id.in_(set(habit_ids)))
+    ).scalars().all()
+    if not owned:
+        return []
+
+    delete_completions_in_chunks(owned, chunk_size)
+    for model in (Reminder, DailyCompletion, HabitStat):
+        db.session.execute(delete(model).where(model.habit_id.in_(owned)),
+                           execution_options={'synchronize_session': False})
+    db.session.execute(delete(Habit).where(Habit.id.in_(owned)))
+
+    seq = next_change_seq(db.session, user_id)
+    db.session.execute(insert(Tombstone), [
+        {'user_id': user_id, 'entity': 'habit', 'entity_id': habit_id, 'change_seq': seq} for habit_id in owned])
+    return owned
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import smtplib
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+
+from .extensions import db
+from .models import User, Habit, Reminder
+from .recurrence import next_occurrence
+
+# Delivery of due reminders.
+# Every reminder keeps the date of its next undelivered occurrence in next_due, and that date is the scan
+# bucket: every tick reads the next batch of reminders due up to today with one range read of the next_due
+# index, which costs the same however many reminders and occurrences were delivered before.
+# A batch is claimed by advancing next_due to the following occurrence of each reminder, or to None, and
+# committed before it is delivered, so concurrent dispatchers never deliver an occurrence twice; occurrences
+# whose delivery fails are made due again and retried on the next tick. Deliveries of a batch run
+# concurrently on an asyncio event loop.
+
+
+class ReminderMessage(NamedTuple):
+    # An occurrence of a reminder as delivered: its day, the message, the name of the habit and the e-mail
+    # address of the user.
+    id: int
+    date: date
+    message: str
+    habit: str
+    email: str
+
+    def to_dict(self) -> dict:
+        data = self._asdict()
+        data['date'] = self.date.isoformat()
+        return data
+
+
+class Sink(ABC):
+    # Delivers reminders somewhere. Subclasses implement the blocking send, which runs in a worker thread.
+    name = 'sink'
+
+    async def deliver(self, reminder: ReminderMessage):
+        await asyncio.to_thread(self.send, reminder)
+
+    @abstractmethod
+    def send(self, reminder: ReminderMessage):
+        pass
+
+    def close(self):
+        pass
+
+
+class SmtpSink(Sink):
+    # Sends reminders as e-mails, e.g. to a local debugging server: `python -m aiosmtpd -n -l localhost:1025`.
+    name = 'smtp'
+
+    def __init__(self, target: Optional[str] = None, sender: str = 'reminders@habittracker.local'):
+        host, _, port = (target or 'localhost:1025').partition(':')
+        self.host, self.port, self.sender = host, int(port or 25), sender
+
+    def send(self, reminder: ReminderMessage):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = reminder.email
+        email['Subject'] = 'Reminder: {}'.format(reminder.habit)
+        email.set_content(reminder.message or '')
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(email)
+
+
+class WebhookSink(Sink):
+    # Posts every reminder as JSON to a URL, standing in for a push notification service.
+    name = 'webhook'
+
+    def __init__(self, target: Optional[str] = None):
+        self.url = target or 'http://localhost:8000/reminders'
+
+    def send(self, reminder: ReminderMessage):
+        request = urllib.request.Request(self.url, data=json.dumps(reminder.to_dict()).encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+
+class LogFileSink(Sink):
+    # Appends every reminder as a JSON line to a file.
+    name = 'log'
+
+    def __init__(self, target: Optional[str] = None):
+        self.file = open(target or 'reminders.log', 'a', encoding='utf-8')
+
+    async def deliver(self, reminder: ReminderMessage):
+        # Appending a line does not block long enough to need a thread.
+        self.send(reminder)
+
+    def send(self, reminder: ReminderMessage):
+        self.file.write(json.dumps(reminder.to_dict()) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+SINKS = {sink.name: sink for sink in (SmtpSink, WebhookSink, LogFileSink)}
+
+
+class DispatchMetrics:
+    # Throughput and lag of a dispatcher. The lag of a reminder is the time from the start of its day
+    # to its delivery.
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ticks = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def record(self, delivered: Sequence[ReminderMessage], failed: int, now: datetime):
+        self.ticks += 1
+        self.dispatched += len(delivered)
+        self.failed += failed
+        for reminder in delivered:
+            self.last_lag = (now - datetime.combine(reminder.date, datetime.min.time())).total_seconds()
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            'ticks': self.ticks,
+            'dispatched': self.dispatched,
+            'failed': self.failed,
+            'throughput': self.dispatched / elapsed if elapsed > 0 else 0.0,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag
+        }
+
+
+def due_statement(today: date, batch_size: int):
+    # Builds the query of the next batch of reminders with an undelivered occurrence up to today.
+    return (
+        select(Reminder.id, Reminder.next_due, Reminder.message, Habit.name, User.email, Reminder.date,
+               Reminder.recurrence, Reminder.weekdays, Reminder.interval_days, Reminder.until)
+        .join(Habit, Reminder.habit_id == Habit.id)
+        .join(User, Habit.user_id == User.id)
+        .where(Reminder.next_due <= today)
+        .order_by(Reminder.next_due, Reminder.id)
+        .limit(batch_size)
+    )
+
+
+def claim_batch(today: date, lookback_days: int, batch_size: int) -> Tuple[List[ReminderMessage], int]:
+    # Reads the next batch of due reminders and advances them to their following occurrence. Returns the
+    # occurrences to deliver and the number of reminders read. Occurrences older than lookback_days are
+    # skipped without delivery, and reminders advanced by another dispatcher in the meantime are left out.
+    # The caller commits.
+    rows = db.session.execute(due_statement(today, batch_size)).all()
+    earliest = today - timedelta(days=lookback_days)
+
+    # Reminders moving between the same occurrences are advanced together, guarded by their old due date.
+    groups = {}
+    for row in rows:
+        following = next_occurrence(row.date, row.recurrence, row.weekdays, row.interval_days, row.until,
+                                    max(row.next_due, earliest - timedelta(days=1)))
+        groups.setdefault((row.next_due, following, row.next_due >= earliest), []).append(row.id)
+
+    claimed = set()
+    now = datetime.now()
+    returning = db.session.connection().dialect.update_returning
+    for (due, following, deliver), ids in groups.items():
+        stmt = update(Reminder.__table__).where(Reminder.id.in_(ids), Reminder.next_due == due).values(
+            next_due=following)
+        if deliver:
+            stmt = stmt.values(dispatched_at=now)
+        if returning:
+            claimed.update(db.session.execute(stmt.returning(Reminder.id)).scalars())
+        else:
+            # Without UPDATE ... RETURNING the claimed rows are unknown, so only one dispatcher may run.
+            db.session.execute(stmt)
+            claimed.update(ids)
+    batch = [ReminderMessage(*row[:5]) for row in rows if row.id in claimed and row.next_due >= earliest]
+    return batch, len(rows)
+
+
+def release(reminders: Sequence[ReminderMessage]):
+    # Makes occurrences whose delivery failed due again. The caller commits.
+    ids_by_day = {}
+    for reminder in reminders:
+        ids_by_day.setdefault(reminder.date, []).append(reminder.id)
+    for day, ids in ids_by_day.items():
+        db.session.execute(update(Reminder.__table__).where(Reminder.id.in_(ids)).values(next_due=day))
+
+
+class Dispatcher:
+    # Worker delivering due reminders through a sink, one batch per tick, and keeping metrics.
+    def __init__(self, sink: Sink, batch_size: int = 500, lookback_days: int = 1, concurrency: int = 50,
+                 report=print):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.lookback_days = lookback_days
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.metrics = DispatchMetrics()
+        self.report = report
+        self.drained = False
+
+    async def _deliver(self, reminder: ReminderMessage) -> bool:
+        async with self.semaphore:
+            try:
+                await self.sink.deliver(reminder)
+                return True
+            except Exception as e:
+                self.report('Could not deliver reminder {}: {}'.format(reminder.id, e))
+                return False
+
+    async def tick(self, today: Optional[date] = None) -> int:
+        # Claims and delivers one batch of due reminders and returns the number delivered.
+        # The semaphore belongs to the running event loop, so every tick makes its own; asyncio.run
+        # starts a new loop for every run of the dispatcher.
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        batch, scanned = claim_batch(today or date.today(), self.lookback_days, self.batch_size)
+        db.session.commit()
+        self.drained = scanned < self.batch_size
+        if not batch:
+            self.metrics.record([], 0, datetime.now())
+            return 0
+
+        results = await asyncio.gather(*(self._deliver(reminder) for reminder in batch))
+        delivered = [reminder for reminder, ok in zip(batch, results) if ok]
+        failed = [reminder for reminder, ok in zip(batch, results) if not ok]
+        release(failed)
+        db.session.commit()
+        self.metrics.record(delivered, len(failed), datetime.now())
+        return len(delivered)
+
+    async def run(self, interval: float = 60.0, once: bool = False):
+        # Runs ticks until stopped. Full batches are followed by the next tick right away, so a backlog
+        # drains at full speed; otherwise the dispatcher sleeps for interval seconds.
+        try:
+            while True:
+                delivered = await self.tick()
+                metrics = self.metrics.snapshot()
+                if delivered:
+                    self.report('Dispatched {} reminders ({:.1f}/s, lag {:.0f}s, max lag {:.0f}s).'.format(
+                        delivered, metrics['throughput'], metrics['last_lag'], metrics['max_lag']))
+                if self.drained:
+                    if once:
+                        return
+                    await asyncio.sleep(interval)
+        finally:
+            self.sink.close()
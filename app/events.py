@@ -0,0 +1,203 @@
+from datetime import date, datetime
+
+from sqlalchemy import event, select, update, func, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from .models import User, Habit, Completion, DailyCompletion, Reminder, Tombstone
+from .rollup import add_completion_days, remove_completion_days
+
+
+# ORM event listeners keeping the derived habit data in sync with the completion table.
+# They run inside the flush, so derived data is written in the same transaction as the completions.
+
+
+def completion_day(value) -> date:
+    # Normalizes the value of Completion.completed_at to a date.
+    # The column is filled with datetimes, plain dates or left to the database default (now).
+    if value is None:
+        return date.today()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def rebuild_habit_stats(session, habit, added=(), removed=()):
+    # Rebuilds the stats columns of a habit from its stored completions, taking the completions
+    # that are about to be inserted or deleted by the current flush into account.
+    removed_ids = {completion.id for completion in removed if completion.id is not None}
+    rows = session.execute(
+        select(Completion.id, Completion.completed_at).where(Completion.habit_id == habit.id)
+    ).all()
+    days = [completion_day(completed_at) for completion_id, completed_at in rows if completion_id not in removed_ids]
+    days += [completion_day(completion.completed_at) for completion in added]
+    habit.rebuild_stats(days)
+
+
+@event.listens_for(Session, 'before_flush')
+def maintain_habit_stats(session, flush_context, instances):
+    # Updates streak, longest streak and last completed day of every habit whose completions
+    # are inserted or deleted by this flush. Habits whose periods change, because their periodicity
+    # or creation day is edited, are rebuilt as well, as their stats and bitmap count in periods.
+    added = [obj for obj in session.new if isinstance(obj, Completion)]
+    removed = [obj for obj in session.deleted if isinstance(obj, Completion)]
+    repartitioned = [
+        obj for obj in session.dirty if isinstance(obj, Habit) and obj not in session.deleted
+        and (inspect(obj).attrs.periodicity.history.has_changes()
+             or inspect(obj).attrs.created_at.history.has_changes())
+    ]
+    if not added and not removed and not repartitioned:
+        return
+
+    owners = {}
+    rebuild = set()
+    with session.no_autoflush:
+        for completion in added + removed:
+            owners[completion] = completion.habit
+            if owners[completion] is None and completion.habit_id is not None:
+                owners[completion] = session.get(Habit, completion.habit_id)
+
+        for completion in sorted(added, key=lambda obj: completion_day(obj.completed_at)):
+            habit = owners[completion]
+            if habit is not None and not habit.record_completion(completion_day(completion.completed_at)):
+                rebuild.add(habit)
+
+        for completion in removed:
+            habit = owners[completion]
+            if habit is not None and habit not in session.deleted:
+                rebuild.add(habit)
+
+        # Their completion counts are changed in SQL during the flush and reloaded afterwards.
+        session.info.setdefault('counted_habits', set()).update(
+            habit for habit in owners.values() if habit is not None)
+
+        # Repartitioned habits with completions in this flush are rebuilt together with them.
+        completed_habits = set(owners.values())
+        rebuild.update(habit for habit in repartitioned if habit in completed_habits)
+        for habit in rebuild:
+            rebuild_habit_stats(
+                session, habit,
+                added=[completion for completion in added if owners[completion] is habit],
+                removed=[completion for completion in removed if owners[completion] is habit]
+            )
+
+        for habit in repartitioned:
+            if habit not in completed_habits:
+                habit.rebuild_stats(session.execute(
+                    select(DailyCompletion.day).where(DailyCompletion.habit_id == habit.id)).scalars().all())
+
+
+def next_change_seq(session, user_id: int) -> int:
+    # Increments the data version of a user and returns the new value, to stamp the rows changed with it.
+    # The increment is evaluated by the database and locks the user's row until the transaction ends, so
+    # concurrent writers never hand out the same version twice and versions become visible in order.
+    users = User.__table__
+    connection = session.connection()
+    stmt = update(users).where(users.c.id == user_id).values(data_version=users.c.data_version + 1)
+    if connection.dialect.update_returning:
+        seq = connection.execute(stmt.returning(users.c.data_version)).scalar_one()
+    else:
+        connection.execute(stmt)
+        seq = connection.execute(select(users.c.data_version).where(users.c.id == user_id)).scalar_one()
+    user = session.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, 'data_version', seq)
+    return seq
+
+
+@event.listens_for(Session, 'before_flush')
+def bump_data_version(session, flush_context, instances):
+    # Increments the data version of every user whose habits, completions or reminders change in this flush
+    # and stamps the changed rows with the new version. Deleted rows leave a tombstone instead; completions
+    # and reminders deleted together with their habit are covered by the habit's tombstone.
+    changed = {}
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, (Habit, Completion, Reminder)):
+                continue
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            habit = obj
+            if not isinstance(obj, Habit):
+                habit = obj.habit
+                if habit is None and obj.habit_id is not None:
+                    habit = session.get(Habit, obj.habit_id)
+                if habit is None or habit in session.deleted:
+                    continue
+                # Completions change the counters of their habit.
+                if isinstance(obj, Completion):
+                    changed.setdefault(habit.user_id, set()).add(habit)
+            changed.setdefault(habit.user_id, set()).add(obj)
+
+        for user_id, objs in changed.items():
+            if user_id is None:
+                continue
+            seq = next_change_seq(session, user_id)
+            for obj in objs:
+                if obj in session.deleted:
+                    session.add(Tombstone(user_id=user_id, entity=obj.__tablename__, entity_id=obj.id,
+                                          change_seq=seq))
+                else:
+                    obj.change_seq = seq
+
+
+def adjust_completed_count(connection, habit_id: int, delta: int):
+    # Adds delta to the completion count of a habit with a single UPDATE evaluated by the database,
+    # so concurrent completions of the same habit never overwrite each other's count.
+    connection.execute(
+        update(Habit.__table__).where(Habit.__table__.c.id == habit_id).values(
+            completed_count=func.coalesce(Habit.__table__.c.completed_count, 0) + delta)
+    )
+
+
+@event.listens_for(Completion, 'after_insert')
+def increment_completed_count(mapper, connection, target):
+    if target.habit_id is not None:
+        adjust_completed_count(connection, target.habit_id, 1)
+
+
+@event.listens_for(Completion, 'after_delete')
+def decrement_completed_count(mapper, connection, target):
+    if target.habit_id is not None:
+        adjust_completed_count(connection, target.habit_id, -1)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def expire_completed_counts(session, flush_context):
+    # Expires the counts changed in SQL, so the next access reads them from the database.
+    for habit in session.info.pop('counted_habits', ()):
+        if inspect(habit).persistent:
+            session.expire(habit, ['completed_count'])
+
+
+def _rollup_row(completion) -> dict:
+    # Builds the rollup row of a completion. Values left to SQL defaults are not loaded during the
+    # flush, so they are read from the instance dict and fall back like completion_day does.
+    completed_at = completion.__dict__.get('completed_at')
+    if not isinstance(completed_at, (date, datetime)):
+        completed_at = None
+    return {
+        'habit_id': completion.habit_id,
+        'day': completion_day(completed_at),
+        'count': completion.__dict__.get('count') or 1
+    }
+
+
+@event.listens_for(Completion, 'after_insert')
+def add_to_daily_rollup(mapper, connection, target):
+    # Adds an inserted completion to the daily rollup table.
+    if target.habit_id is not None:
+        add_completion_days(connection, [_rollup_row(target)])
+
+
+@event.listens_for(Completion, 'before_delete')
+def remove_from_daily_rollup(mapper, connection, target):
+    # Removes a completion about to be deleted from the daily rollup table.
+    # The row still exists at this point, so expired attributes can be loaded.
+    if target.habit_id is not None:
+        remove_completion_days(connection, [{
+            'habit_id': target.habit_id,
+            'day': completion_day(target.completed_at),
+            'count': target.count or 1
+        }])
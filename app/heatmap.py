@@ -0,0 +1,70 @@
+from datetime import date, timedelta, MINYEAR, MAXYEAR
+from typing import List, Optional
+
+from sqlalchemy import select
+
+from .extensions import db
+from .models import Habit, DailyCompletion
+
+# Year-at-a-glance heatmap of all habits of a user.
+# The habits x days matrix is built from a single range query on the daily rollup and encoded
+# as one '0'/'1' string per habit, with one character per day of the year.
+
+
+def valid_year(year: int) -> bool:
+    # Years a heatmap can be built for: those of Python dates.
+    return MINYEAR <= year <= MAXYEAR
+
+
+def year_heatmap(user_id: int, year: int) -> dict:
+    # Returns the heatmap of a year: the habits of the user with their day bitstrings.
+    # Raises ValueError for a year outside the range of Python dates.
+    if not valid_year(year):
+        raise ValueError('Invalid year: {}'.format(year))
+    start, end = date(year, 1, 1), date(year, 12, 31)
+    length = (end - start).days + 1
+
+    habits = db.session.execute(
+        select(Habit.id, Habit.name, Habit.periodicity).where(Habit.user_id == user_id).order_by(Habit.id)
+    ).all()
+    bits = {habit_id: bytearray(b'0' * length) for habit_id, _, _ in habits}
+
+    rows = db.session.execute(
+        select(DailyCompletion.habit_id, DailyCompletion.day)
+        .join(Habit, Habit.id == DailyCompletion.habit_id)
+        .where(Habit.user_id == user_id, DailyCompletion.day >= start, DailyCompletion.day <= end)
+    )
+    for habit_id, day in rows:
+        bits[habit_id][(day - start).days] = ord('1')
+
+    return {
+        'year': year,
+        'start': start.isoformat(),
+        'days': length,
+        'habits': [{'id': habit_id, 'name': name, 'periodicity': periodicity, 'bits': bits[habit_id].decode()}
+                   for habit_id, name, periodicity in habits]
+    }
+
+
+def heatmap_weeks(heatmap: dict, levels: int = 4) -> List[List[Optional[dict]]]:
+    # Arranges the heatmap as GitHub-style week columns of seven days (Monday first). Each day holds the
+    # number of habits completed on it and an intensity level from 0 to levels; days outside the year are None.
+    start = date.fromisoformat(heatmap['start'])
+    habit_count = len(heatmap['habits'])
+    totals = [sum(habit['bits'][index] == '1' for habit in heatmap['habits']) for index in range(heatmap['days'])]
+
+    weeks = []
+    for week_index in range((start.weekday() + heatmap['days'] + 6) // 7):
+        week = []
+        for weekday in range(7):
+            # Days are counted from the start of the year, so the weeks around the first and last year
+            # of the date range never need dates outside of it.
+            index = week_index * 7 + weekday - start.weekday()
+            if 0 <= index < heatmap['days']:
+                level = -(-levels * totals[index] // habit_count) if habit_count else 0
+                week.append({'date': (start + timedelta(days=index)).isoformat(), 'count': totals[index],
+                             'level': level})
+            else:
+                week.append(None)
+        weeks.append(week)
+    return weeks
@@ -0,0 +1,63 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import Optional
+
+from flask import request, session, make_response, Response
+from flask_login import current_user
+
+from .cache import data_version
+
+# HTTP response validation based on the data version of a user.
+# The ETag of a response is derived from the user's data version and the request parameters, so it can be
+# checked against If-None-Match before any expensive query runs.
+
+
+def user_etag(user_id: int, *parts) -> str:
+    # Returns a strong ETag for the data of a user as seen through the given request parameters.
+    key = '/'.join(str(part) for part in (user_id, data_version(user_id)) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    # Returns a 304 response if the client already holds the representation with the given ETag.
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        set_validators(response, etag)
+        return response
+    return None
+
+
+def set_validators(response: Response, etag: str) -> Response:
+    # Attaches the ETag to a response and makes clients revalidate it on every use.
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional_on_data_version(hourly: bool = False):
+    # Decorator answering GET requests of logged-in users with 304 Not Modified while the user's data,
+    # the requested URL and the current day are unchanged, before the view runs any query.
+    # Pages depending on the time of day or embedding CSRF tokens pass hourly=True to also vary by hour.
+    # Requests with pending flash messages always render, so the messages are shown.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or not current_user.is_authenticated or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            now = datetime.now()
+            etag = user_etag(current_user.id, request.full_path, now.strftime('%Y-%m-%dT%H' if hourly else '%Y-%m-%d'))
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,7 +1,10 @@
-from datetime import timedelta, date
+from datetime import timedelta, date, datetime
+from typing import Iterator, List, Optional
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from . import db
+from . import bitmap
+from . import recurrence as rules
 
 
 # Database model for a user. Inherits from flask_login's UserMixin and SQLAlchemy's Model.
@@ -10,6 +13,9 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
+    # Incremented whenever the user's habits, completions or reminders change, used to invalidate cached
+    # results. It doubles as the user's change sequence: changed rows are stamped with it, see events.py.
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     habits = db.relationship('Habit', backref='user', lazy='dynamic')
 
     def __init__(self, username: str, email: str):
@@ -29,6 +35,11 @@ class User(UserMixin, db.Model):
 # Database model for user habits. Each habit has a name,
 # description, periodicity and is related to the user.
 class Habit(db.Model):
+    __table_args__ = (
+        db.Index('ix_habit_user_id_periodicity', 'user_id', 'periodicity'),
+        db.Index('ix_habit_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_habit_user_id_change_seq', 'user_id', 'change_seq'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     description = db.Column(db.String(128))
@@ -36,10 +47,19 @@ class Habit(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     completed = db.Column(db. Boolean, default=False)
     streak = db.Column(db.Integer, default=0)
+    longest_streak = db.Column(db.Integer, default=0)
+    last_completed = db.Column(db.Date, nullable=True)
+    # One bit per period (day or week) from bitmap_origin on, set if the habit was completed in it.
+    completion_bitmap = db.Column(db.LargeBinary, nullable=True)
+    bitmap_origin = db.Column(db.Date, nullable=True)
     completions = db.relationship('Completion', backref='habit', lazy='dynamic')
     reminders = db.relationship('Reminder', backref='habit', lazy='dynamic')
-    created_at = db.Column(db.DateTime, default=db.func.now())
+    # Set in Python (UTC like the database clock), so SQLite stores it in the format cursors compare against.
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Number of completions, only changed by the atomic SQL increments of app.events.
     completed_count = db.Column(db.Integer, nullable=True, default=0)
+    # Data version of the user when the habit last changed, served by the change feed.
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     @property
     def is_in_current_period(self):
@@ -66,17 +86,143 @@ class Habit(db.Model):
         else:
             raise ValueError('Invalid periodicity: ' + self.periodicity)
 
+    def period_of(self, day: date) -> int:
+        # Maps a calendar day to the ordinal of the habit period containing it.
+        # Daily habits use the day ordinal, weekly habits count weeks starting on the weekday of creation.
+        if self.periodicity == 'weekly':
+            created = self.created_at.date() if self.created_at is not None else date.today()
+            return (day.toordinal() - created.toordinal() % 7) // 7
+        return day.toordinal()
+
+    def period_start(self, period: int) -> date:
+        # Returns the first day of the habit period with the given ordinal.
+        if self.periodicity == 'weekly':
+            created = self.created_at.date() if self.created_at is not None else date.today()
+            return date.fromordinal(period * 7 + created.toordinal() % 7)
+        return date.fromordinal(period)
+
+    def _bitmap_index(self, day: date) -> int:
+        # Returns the bit of the completion bitmap for the period of a day, moving the origin
+        # of the bitmap back if the day lies before it.
+        period = self.period_of(day)
+        if self.bitmap_origin is None:
+            self.bitmap_origin = self.period_start(period)
+            self.completion_bitmap = b''
+        origin = self.period_of(self.bitmap_origin)
+        if period < origin:
+            self.completion_bitmap = bitmap.shift(self.completion_bitmap, origin - period)
+            self.bitmap_origin = self.period_start(period)
+            origin = period
+        return period - origin
+
+    def completed_periods(self, start: date, end: date) -> List[bool]:
+        # Returns one flag per habit period from the period of start to the period of end,
+        # sliced from the completion bitmap without touching the completion table.
+        first, last = self.period_of(start), self.period_of(end)
+        if self.bitmap_origin is None:
+            return [False] * (last - first + 1)
+        origin = self.period_of(self.bitmap_origin)
+        return bitmap.slice_bits(self.completion_bitmap, first - origin, last - origin + 1)
+
+    @property
+    def completed_periods_count(self) -> int:
+        # Number of periods with at least one completion.
+        return bitmap.popcount(self.completion_bitmap)
+
+    @property
+    def bitmap_longest_streak(self) -> int:
+        # Longest run of completed periods, read from the completion bitmap.
+        return bitmap.longest_run(self.completion_bitmap)
+
+    def completion_rate(self, today: Optional[date] = None) -> float:
+        # Share of the periods from the creation of the habit to today, both included, that were completed,
+        # sliced from the completion bitmap.
+        today = today or date.today()
+        created = self.created_at.date() if self.created_at is not None else today
+        if created > today:
+            return 0.0
+        periods = self.completed_periods(created, today)
+        return round(sum(periods) / len(periods), 4)
+
+    @property
+    def current_streak(self) -> int:
+        # The maintained streak while it is alive, i.e. the habit was completed in the current or the previous
+        # period, otherwise 0. The streak column only changes when a completion is recorded.
+        if self.last_completed is None or self.period_of(self.last_completed) < self.period_of(date.today()) - 1:
+            return 0
+        return self.streak or 0
+
+    def record_completion(self, day: date) -> bool:
+        # Folds a single completion into the maintained stats columns and the completion bitmap.
+        # Returns False if the completion lies in an earlier period than the last completion,
+        # in which case the stats have to be rebuilt from all completions.
+        self.completion_bitmap = bitmap.set_bit(self.completion_bitmap, self._bitmap_index(day))
+        if self.last_completed is not None and day <= self.last_completed:
+            return self.period_of(day) == self.period_of(self.last_completed)
+
+        if self.last_completed is None or not self.streak:
+            self.streak = 1
+        else:
+            gap = self.period_of(day) - self.period_of(self.last_completed)
+            if gap == 1:
+                self.streak += 1
+            elif gap > 1:
+                self.streak = 1
+        self.last_completed = day
+        self.longest_streak = max(self.longest_streak or 0, self.streak)
+        self.refresh_completed()
+        return True
+
+    def rebuild_stats(self, days):
+        # Recomputes the maintained stats columns and the completion bitmap from the days of all
+        # completions of the habit. The completion count is maintained separately by SQL increments.
+        periods = sorted({self.period_of(day) for day in days})
+        self.bitmap_origin = self.period_start(periods[0]) if periods else None
+        self.completion_bitmap = bitmap.from_indexes(period - periods[0] for period in periods) if periods else None
+        self.last_completed = max(days) if days else None
+        self.streak = 0
+        self.longest_streak = 0
+        previous = None
+        for period in periods:
+            self.streak = self.streak + 1 if previous is not None and period == previous + 1 else 1
+            self.longest_streak = max(self.longest_streak, self.streak)
+            previous = period
+        self.refresh_completed()
+
+    def refresh_completed(self, today: Optional[date] = None):
+        # Sets the completed flag if the habit was completed in the current period.
+        # The flag is reset for all habits at period boundaries by `flask habits rollover`.
+        today = today or date.today()
+        self.completed = (self.last_completed is not None
+                          and self.period_of(self.last_completed) == self.period_of(today))
+
     def __repr__(self):
         return '<Habit ' + self.name + '>'
 
 
+def _completion_day(context) -> date:
+    # Default of Completion.day: the day of the completion timestamp, or today if the timestamp
+    # is left to the database default.
+    completed_at = context.get_current_parameters().get('completed_at')
+    if completed_at is None or not isinstance(completed_at, date):
+        return date.today()
+    return completed_at.date() if isinstance(completed_at, datetime) else completed_at
+
+
 # Database model for habit completion.
 # Each completion has a timestamp and is related to a habit.
+# There is one completion per habit and day; repeated completions of a day increment its count.
 class Completion(db.Model):
+    __table_args__ = (
+        db.Index('ix_completion_habit_id_day', 'habit_id', 'day', unique=True),
+        db.Index('ix_completion_habit_id_change_seq', 'habit_id', 'change_seq'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     completed_at = db.Column(db.DateTime, default=db.func.now())
+    day = db.Column(db.Date, nullable=False, default=_completion_day)
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'))
     count = db.Column(db.Integer, default=1)  # Add this line
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     @property
     def completed_date(self):
@@ -86,13 +232,123 @@ class Completion(db.Model):
         return '<Completion ' + str(self.id) + '>'
 
 
+# Database model for the daily rollup of habit completions.
+# Each row holds the number of completions of a habit on one day.
+# Rows are maintained by ORM events on Completion, see events.py.
+class DailyCompletion(db.Model):
+    __tablename__ = 'daily_completion'
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<DailyCompletion ' + str(self.habit_id) + ' ' + str(self.day) + '>'
+
+
+# Database model for precomputed per-habit statistics, written by `flask analytics precompute`.
+# A row is fresh while its data_version matches the data version of the user.
+class HabitStat(db.Model):
+    __tablename__ = 'habit_stat'
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    completions_count = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    completion_rate = db.Column(db.Float, nullable=False, default=0.0)
+    data_version = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<HabitStat ' + str(self.habit_id) + '>'
+
+
+# Database model for the progress of resumable background jobs.
+# Position is the last id a job has fully processed.
+class JobCheckpoint(db.Model):
+    __tablename__ = 'job_checkpoint'
+    name = db.Column(db.String(64), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<JobCheckpoint ' + self.name + '>'
+
+
+# Database model for the idempotency keys of completions synced by offline clients.
+# A key is stored in the transaction applying its completion, so replaying the key has no effect.
+class SyncReceipt(db.Model):
+    __tablename__ = 'sync_receipt'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<SyncReceipt ' + self.key + '>'
+
+
+# Database model for deleted rows, served by the change feed so clients can drop their copies.
+# Entity is 'habit', 'completion' or 'reminder'; a deleted habit implies its completions and reminders.
+class Tombstone(db.Model):
+    __tablename__ = 'tombstone'
+    __table_args__ = (db.Index('ix_tombstone_user_id_change_seq', 'user_id', 'change_seq'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return '<Tombstone ' + self.entity + ' ' + str(self.entity_id) + '>'
+
+
 # Database model for habit reminders.
 # Each reminder has a message, date and is related to a habit.
+# A reminder is a rule: it occurs once on its date or, with a recurrence, repeatedly from its date on,
+# see recurrence.py. Occurrences are generated when needed and never stored.
 class Reminder(db.Model):
+    __table_args__ = (
+        db.Index('ix_reminder_date_habit_id', 'date', 'habit_id'),
+        db.Index('ix_reminder_habit_id_date', 'habit_id', 'date'),
+        db.Index('ix_reminder_habit_id_change_seq', 'habit_id', 'change_seq'),
+        db.Index('ix_reminder_next_due', 'next_due'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.String(255))
     date = db.Column(db.Date)
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'))
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # None for a single reminder, or one of recurrence.RECURRENCES.
+    recurrence = db.Column(db.String(16), nullable=True)
+    # Bitmask of the weekdays of a weekly reminder, bit 0 being Monday.
+    weekdays = db.Column(db.Integer, nullable=True)
+    interval_days = db.Column(db.Integer, nullable=True)
+    # Last day a recurring reminder may occur on.
+    until = db.Column(db.Date, nullable=True)
+    # Next occurrence the dispatcher has not delivered yet, None when there is none; see dispatcher.py.
+    next_due = db.Column(db.Date, nullable=True)
+    # Set when the dispatcher last delivered the reminder.
+    dispatched_at = db.Column(db.DateTime, nullable=True)
+
+    def occurrences(self, start: date, end: Optional[date] = None) -> Iterator[date]:
+        return rules.occurrences(self.date, self.recurrence, self.weekdays, self.interval_days, self.until,
+                                 start, end)
+
+    def occurs_on(self, day: date) -> bool:
+        return next(self.occurrences(day, day), None) is not None
+
+    def next_occurrence(self, after: date) -> Optional[date]:
+        return rules.next_occurrence(self.date, self.recurrence, self.weekdays, self.interval_days,
+                                     self.until, after)
+
+    @property
+    def schedule(self) -> str:
+        return rules.describe(self.date, self.recurrence, self.weekdays, self.interval_days, self.until)
+
+    def reschedule(self, today: date):
+        # Sets the next due occurrence after the rule changed. An occurrence delivered today is not
+        # delivered again.
+        delivered_today = self.dispatched_at is not None and self.dispatched_at.date() >= today
+        self.next_due = self.next_occurrence(today if delivered_today else today - timedelta(days=1))
 
     def __repr__(self):
         return '<Reminder ' + self.message + '>'
@@ -0,0 +1,87 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import List, Optional, Sequence, Tuple
+
+from flask import current_app, request, abort, url_for
+from sqlalchemy import tuple_
+
+from .extensions import db
+
+# Keyset pagination for the list pages.
+# A page continues after the sort key of the last row of the previous page, so fetching a page costs
+# an index range read of page size rows however deep the user pages. The sort key travels to the client
+# as an opaque cursor: the key values as JSON in URL-safe base64.
+
+
+def encode_cursor(values: Sequence) -> str:
+    serialized = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(serialized).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> Tuple:
+    # Decodes a cursor into the key values of the given columns. Raises ValueError for a malformed cursor.
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Malformed cursor') from e
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Malformed cursor')
+
+    decoded = []
+    for value, column in zip(values, columns):
+        python_type = column.type.python_type
+        if python_type in (date, datetime) and not isinstance(value, str):
+            raise ValueError('Malformed cursor')
+        if python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is date:
+            value = date.fromisoformat(value)
+        elif not isinstance(value, python_type):
+            raise ValueError('Malformed cursor')
+        decoded.append(value)
+    return tuple(decoded)
+
+
+def page_size() -> int:
+    # Page size of the current request: the page_size argument, capped by MAX_PAGE_SIZE, or PAGE_SIZE.
+    size = request.args.get('page_size', default=current_app.config['PAGE_SIZE'], type=int)
+    return min(max(size, 1), current_app.config['MAX_PAGE_SIZE'])
+
+
+def keyset_page(stmt, columns: Sequence, cursor: Optional[str], size: int,
+                descending: bool = False) -> Tuple[List, Optional[str]]:
+    # Runs the select statement of a mapped class ordered by the key columns, starting after the cursor,
+    # and returns the objects of one page together with the cursor of the next page (None on the last page).
+    # The key columns have to identify a row uniquely and must not be NULL.
+    if cursor:
+        after = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        stmt = stmt.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    order = [column.desc() for column in columns] if descending else list(columns)
+    rows = db.session.execute(stmt.order_by(*order).limit(size + 1)).scalars().all()
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+
+def request_page(stmt, columns: Sequence, descending: bool = False) -> Tuple[List, Optional[str]]:
+    # keyset_page for the cursor and page size of the current request; a malformed cursor is a 400.
+    try:
+        return keyset_page(stmt, columns, request.args.get('cursor'), page_size(), descending)
+    except ValueError:
+        abort(400)
+
+
+def page_url(cursor: Optional[str]) -> str:
+    # URL of the current page with the given cursor, or of the first page if cursor is None.
+    args = request.args.to_dict()
+    args.update(request.view_args or {})
+    args.pop('cursor', None)
+    if cursor:
+        args['cursor'] = cursor
+    return url_for(request.endpoint, **args)
@@ -0,0 +1,193 @@
+import multiprocessing
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, delete, insert
+
+from .extensions import db
+from .models import User, Habit, DailyCompletion, HabitStat, JobCheckpoint
+from .streaks import day_number, to_periods, longest_runs, current_run
+
+# Nightly precomputation of per-habit statistics.
+# Users are walked in id order and in chunks. Every chunk is computed by a worker process with
+# its own application and database connection, and the results are bulk-written by the parent process
+# together with a checkpoint, so an interrupted run continues after the last written chunk.
+# Chunks are read lazily, a few per worker ahead of the writes, so memory does not grow with the user count.
+
+CHECKPOINT_NAME = 'analytics-precompute'
+
+_worker_app = None
+
+
+def compute_user_stats(user_ids: Sequence[int], today: Optional[date] = None) -> List[dict]:
+    # Computes completion count, longest and current streak and period completion rate of every habit of
+    # the given users. Completion days are fetched as integer offsets from the habit's creation day.
+    today = today or date.today()
+    versions = dict(db.session.execute(select(User.id, User.data_version).where(User.id.in_(user_ids))).all())
+    habits = db.session.execute(
+        select(Habit.id, Habit.user_id, Habit.periodicity, Habit.created_at, Habit.completed_count)
+        .where(Habit.user_id.in_(user_ids)).order_by(Habit.id)
+    ).all()
+    if not habits:
+        return []
+
+    offsets = db.session.execute(
+        select(DailyCompletion.habit_id, day_number(DailyCompletion.day) - day_number(Habit.created_at))
+        .join(Habit, Habit.id == DailyCompletion.habit_id)
+        .where(Habit.user_id.in_(user_ids)).order_by(DailyCompletion.habit_id)
+    ).all()
+    offsets_by_habit = {
+        habit_id: np.fromiter((offset for _, offset in rows), dtype=np.int64)
+        for habit_id, rows in groupby(offsets, key=lambda row: row[0])
+    }
+
+    empty = np.zeros(0, dtype=np.int64)
+    period_arrays = [to_periods(offsets_by_habit.get(habit_id, empty), periodicity)
+                     for habit_id, _, periodicity, _, _ in habits]
+    longest = longest_runs(period_arrays)
+
+    computed_at = datetime.now()
+    results = []
+    for (habit_id, user_id, periodicity, created_at, completed_count), periods, longest_streak in zip(
+            habits, period_arrays, longest):
+        created = created_at.date() if created_at is not None else today
+        today_period = to_periods([(today - created).days], periodicity)[0]
+        alive = periods.size and periods[-1] >= today_period - 1
+        elapsed = max(int(today_period) + 1, 1)
+        completed = int(np.count_nonzero((periods >= 0) & (periods <= today_period)))
+        results.append({
+            'habit_id': habit_id,
+            'user_id': user_id,
+            'completions_count': completed_count or 0,
+            'longest_streak': int(longest_streak),
+            'current_streak': current_run(periods) if alive else 0,
+            'completion_rate': round(min(1.0, completed / elapsed), 4),
+            'data_version': versions.get(user_id) or 0,
+            'computed_at': computed_at
+        })
+    return results
+
+
+def write_user_stats(user_ids: Sequence[int], rows: List[dict]):
+    # Replaces the stats rows of the given users with the computed rows in one transaction.
+    connection = db.session.connection()
+    connection.execute(delete(HabitStat.__table__).where(HabitStat.user_id.in_(user_ids)))
+    if rows:
+        connection.execute(insert(HabitStat.__table__), rows)
+
+
+def _init_worker(config_name: str):
+    # Pool initializer creating the application, and so the database engine, of a worker process.
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app(config_name)
+
+
+def _compute_chunk(user_ids: Sequence[int]) -> List[dict]:
+    with _worker_app.app_context():
+        try:
+            return compute_user_stats(user_ids)
+        finally:
+            db.session.remove()
+
+
+def _user_chunks(start_after: int, chunk_size: int) -> Iterator[List[int]]:
+    # Yields the ids of all users after the given id in ascending chunks, using keyset pagination.
+    position = start_after
+    while True:
+        user_ids = db.session.execute(
+            select(User.id).where(User.id > position).order_by(User.id).limit(chunk_size)
+        ).scalars().all()
+        if not user_ids:
+            return
+        yield user_ids
+        position = user_ids[-1]
+
+
+def _computed_chunks(app, chunks: Iterable[List[int]], workers: int) -> Iterator[Tuple[List[int], List[dict]]]:
+    # Yields every chunk of user ids with its computed rows, in chunk order. With several workers the
+    # chunks are handed to a process pool as they are read, keeping at most two per worker in flight.
+    if workers <= 1:
+        for user_ids in chunks:
+            yield user_ids, compute_user_stats(user_ids)
+        return
+
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(app.config['CONFIG_NAME'],))
+    try:
+        pending = deque()
+        for user_ids in chunks:
+            pending.append((user_ids, pool.apply_async(_compute_chunk, (user_ids,))))
+            if len(pending) >= 2 * workers:
+                user_ids, result = pending.popleft()
+                yield user_ids, result.get()
+        while pending:
+            user_ids, result = pending.popleft()
+            yield user_ids, result.get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _save_checkpoint(position: int):
+    checkpoint = db.session.get(JobCheckpoint, CHECKPOINT_NAME)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=CHECKPOINT_NAME)
+        db.session.add(checkpoint)
+    checkpoint.position = position
+    checkpoint.updated_at = datetime.now()
+
+
+def precompute_stats(app, workers: int = 1, chunk_size: int = 500, resume: bool = True, report=print) -> int:
+    # Precomputes the stats of all users and returns the number of users processed.
+    # With a single worker the chunks are computed in-process.
+    checkpoint = db.session.get(JobCheckpoint, CHECKPOINT_NAME) if resume else None
+    start_after = checkpoint.position if checkpoint is not None else 0
+    if start_after:
+        report('Resuming after user {}.'.format(start_after))
+
+    started = time.monotonic()
+    processed = 0
+
+    # Results arrive in chunk order, so the checkpoint always covers every user before it.
+    for user_ids, rows in _computed_chunks(app, _user_chunks(start_after, chunk_size), workers):
+        write_user_stats(user_ids, rows)
+        _save_checkpoint(user_ids[-1])
+        db.session.commit()
+        processed += len(user_ids)
+        elapsed = time.monotonic() - started
+        report('Processed {} users ({:.1f} users/s).'.format(processed, processed / elapsed if elapsed else 0.0))
+
+    # The run is complete, so the next run starts from the beginning again.
+    _save_checkpoint(0)
+    db.session.commit()
+    return processed
+
+
+def fresh_habit_stats(user_id: int, periodicity: Optional[str] = None, max_age: Optional[timedelta] = None,
+                      habit_ids: Optional[Sequence[int]] = None):
+    # Returns the precomputed stats rows of the user's habits in the shape of stats.habit_stats,
+    # or None if any of the habits has no stats row that matches the user's current data version.
+    stmt = select(
+        Habit.id, Habit.name, Habit.description, Habit.periodicity,
+        HabitStat.completions_count, HabitStat.longest_streak, HabitStat.completion_rate,
+        HabitStat.data_version, HabitStat.computed_at, User.data_version.label('user_version')
+    ).join(User, User.id == Habit.user_id).outerjoin(HabitStat, HabitStat.habit_id == Habit.id).where(
+        Habit.user_id == user_id)
+    if periodicity is not None:
+        stmt = stmt.where(Habit.periodicity == periodicity)
+    if habit_ids is not None:
+        stmt = stmt.where(Habit.id.in_(habit_ids))
+    rows = db.session.execute(stmt.order_by(Habit.id)).mappings().all()
+
+    cutoff = datetime.now() - max_age if max_age is not None else None
+    for row in rows:
+        if row['data_version'] is None or row['data_version'] != row['user_version']:
+            return None
+        if cutoff is not None and row['computed_at'] < cutoff:
+            return None
+    keys = ('id', 'name', 'description', 'periodicity', 'completions_count', 'longest_streak', 'completion_rate')
+    return [{key: row[key] for key in keys} for row in rows]
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+from typing import Iterable, Iterator, Optional
+
+# Recurrence rules of reminders.
+# A reminder is stored once, as a rule: its first date, a recurrence ('daily', 'weekly' on the weekdays of
+# a bitmask with bit 0 for Monday, or every interval_days days) and an optional last date. Occurrences are
+# never stored; they are generated lazily for the date window a caller asks for, so an open-ended rule
+# costs one row however long it runs. A reminder without recurrence occurs once, on its first date.
+
+RECURRENCES = ('daily', 'weekly', 'interval')
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def weekday_mask(weekdays: Iterable[int]) -> int:
+    # Builds the bitmask of the given weekdays (0 for Monday to 6 for Sunday).
+    mask = 0
+    for weekday in weekdays:
+        if not 0 <= weekday <= 6:
+            raise ValueError('Invalid weekday: {}'.format(weekday))
+        mask |= 1 << weekday
+    return mask
+
+
+def occurrences(first: date, recurrence: Optional[str], weekdays: Optional[int], interval_days: Optional[int],
+                until: Optional[date], start: date, end: Optional[date] = None) -> Iterator[date]:
+    # Yields the occurrences of a rule from start to end, both inclusive, in order. Without an end and
+    # a last date the generator is infinite, so callers take as many occurrences as they need.
+    last = min(day for day in (until, end) if day is not None) if until or end else None
+    if recurrence is None:
+        if start <= first and (end is None or first <= end):
+            yield first
+        return
+
+    day, step = max(first, start), 1
+    if recurrence == 'interval':
+        step = interval_days or 1
+        day += timedelta(days=-(day - first).days % step)
+    elif recurrence == 'weekly' and not weekdays:
+        return
+    while last is None or day <= last:
+        if recurrence != 'weekly' or weekdays >> day.weekday() & 1:
+            yield day
+        day += timedelta(days=step)
+
+
+def next_occurrence(first: date, recurrence: Optional[str], weekdays: Optional[int], interval_days: Optional[int],
+                    until: Optional[date], after: date) -> Optional[date]:
+    # Returns the first occurrence of a rule after the given day, or None if there is none.
+    return next(occurrences(first, recurrence, weekdays, interval_days, until, after + timedelta(days=1)), None)
+
+
+def describe(first: date, recurrence: Optional[str], weekdays: Optional[int], interval_days: Optional[int],
+             until: Optional[date]) -> str:
+    # Describes a rule for display, e.g. 'Weekly on Mon, Thu from 2024-05-01'.
+    if recurrence is None:
+        return 'Once on {}'.format(first.isoformat())
+    if recurrence == 'daily':
+        text = 'Daily'
+    elif recurrence == 'weekly':
+        names = [name for weekday, name in enumerate(WEEKDAY_NAMES) if (weekdays or 0) >> weekday & 1]
+        text = 'Weekly on ' + ', '.join(names)
+    else:
+        text = 'Every {} days'.format(interval_days)
+    text += ' from {}'.format(first.isoformat())
+    if until is not None:
+        text += ' until {}'.format(until.isoformat())
+    return text
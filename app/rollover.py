@@ -0,0 +1,52 @@
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy import select, update, literal, or_, Date
+
+from .extensions import db
+from .models import User, Habit
+from .streaks import period_number
+
+# Period rollover of the Habit.completed flag.
+# When a new day or week starts, habits completed in the previous period are reset with one UPDATE
+# per periodicity, evaluated entirely by the database. Meant to run shortly after midnight, e.g. from cron.
+# The data versions of the owners are bumped first, with one UPDATE per periodicity as well, and the reset
+# habits are stamped with them, so the change feed serves the reset flags.
+
+PERIODICITIES = ('daily', 'weekly')
+
+
+def rollover_condition(periodicity: str, today: date):
+    # Selects the completed habits of a periodicity whose last completion lies in an earlier period than today.
+    if periodicity == 'weekly':
+        outdated = period_number(Habit.last_completed) < period_number(literal(today, Date))
+    else:
+        outdated = Habit.last_completed < today
+    return Habit.periodicity == periodicity, Habit.completed.is_(True), or_(Habit.last_completed.is_(None), outdated)
+
+
+def bump_statement(periodicity: str, today: date):
+    # Builds the UPDATE incrementing the data version of the owners of the habits about to be reset.
+    owners = select(Habit.user_id).where(*rollover_condition(periodicity, today))
+    return update(User.__table__).where(User.id.in_(owners)).values(data_version=User.data_version + 1)
+
+
+def rollover_statement(periodicity: str, today: date):
+    # Builds the UPDATE resetting the flag of the habits, stamping them with the data version of their owner.
+    version = select(User.data_version).where(User.id == Habit.user_id).scalar_subquery()
+    return update(Habit.__table__).where(*rollover_condition(periodicity, today)).values(
+        completed=False, change_seq=version)
+
+
+def rollover_completed(today: Optional[date] = None, report=print) -> Dict[str, int]:
+    # Resets the completed flag of all habits whose period has ended and returns the number of rows
+    # touched per periodicity. The caller commits.
+    today = today or date.today()
+    touched = {}
+    for periodicity in PERIODICITIES:
+        started = time.monotonic()
+        db.session.execute(bump_statement(periodicity, today))
+        touched[periodicity] = db.session.execute(rollover_statement(periodicity, today)).rowcount
+        report('Reset {} {} habits in {:.3f}s.'.format(touched[periodicity], periodicity, time.monotonic() - started))
+    return touched
@@ -0,0 +1,82 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import update, delete, insert, select, func, bindparam
+from sqlalchemy.dialects import sqlite, postgresql, mysql
+
+from .models import DailyCompletion, Completion
+
+# Maintenance of the daily completion rollup table.
+# The functions work on a Connection and take lists of {'habit_id', 'day', 'count'} rows,
+# so a single completion and a bulk write go through the same executemany statements.
+
+daily_completion = DailyCompletion.__table__
+
+
+def _upsert_statement(dialect_name: str):
+    # Returns an INSERT adding the count to an existing (habit_id, day) row, or None if the
+    # dialect has no native upsert.
+    if dialect_name in ('sqlite', 'postgresql'):
+        module = sqlite if dialect_name == 'sqlite' else postgresql
+        stmt = module.insert(daily_completion)
+        return stmt.on_conflict_do_update(
+            index_elements=[daily_completion.c.habit_id, daily_completion.c.day],
+            set_={'count': daily_completion.c.count + stmt.excluded['count']}
+        )
+    if dialect_name == 'mysql':
+        stmt = mysql.insert(daily_completion)
+        return stmt.on_duplicate_key_update(count=daily_completion.c.count + stmt.inserted['count'])
+    return None
+
+
+def add_completion_days(connection, rows: Iterable[dict]):
+    # Adds the completion counts of the given rows to the rollup, creating missing days.
+    rows = list(rows)
+    if not rows:
+        return
+    stmt = _upsert_statement(connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(daily_completion)
+            .where(daily_completion.c.habit_id == row['habit_id'], daily_completion.c.day == row['day'])
+            .values(count=daily_completion.c.count + row['count'])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(daily_completion).values(**row))
+
+
+def remove_completion_days(connection, rows: Iterable[dict]):
+    # Subtracts the completion counts of the given rows from the rollup and drops emptied days.
+    rows = list(rows)
+    if not rows:
+        return
+    connection.execute(
+        update(daily_completion)
+        .where(daily_completion.c.habit_id == bindparam('b_habit_id'), daily_completion.c.day == bindparam('b_day'))
+        .values(count=daily_completion.c.count - bindparam('b_count')),
+        [{'b_habit_id': row['habit_id'], 'b_day': row['day'], 'b_count': row['count']} for row in rows]
+    )
+    connection.execute(
+        delete(daily_completion).where(
+            daily_completion.c.habit_id.in_({row['habit_id'] for row in rows}),
+            daily_completion.c.count <= 0
+        )
+    )
+
+
+def rebuild_completion_days(connection, habit_ids: Optional[Iterable[int]] = None):
+    # Rebuilds the rollup rows of the given habits (or of all habits) from the raw completions.
+    source = select(
+        Completion.habit_id, Completion.day, func.sum(func.coalesce(Completion.count, 1))
+    ).where(Completion.habit_id.isnot(None)).group_by(Completion.habit_id, Completion.day)
+    purge = delete(daily_completion)
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        source = source.where(Completion.habit_id.in_(habit_ids))
+        purge = purge.where(daily_completion.c.habit_id.in_(habit_ids))
+
+    connection.execute(purge)
+    connection.execute(insert(daily_completion).from_select(['habit_id', 'day', 'count'], source))
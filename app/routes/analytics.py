@@ -1,11 +1,19 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, jsonify, \
+    Response, stream_with_context, abort
+from datetime import date, timedelta, MINYEAR, MAXYEAR
 from flask_login import login_required
-from ..models import Habit, Completion
-from itertools import groupby
+from sqlalchemy import func
+from ..models import Habit, db
 from ..forms import FilterPeriodicityForm, SelectHabitForm
+from ..streaks import longest_streaks, longest_streak_for_habit
+from ..stats import habit_stats
+from ..precompute import fresh_habit_stats
+from ..cache import analytics_cache, cached_per_user
+from ..timeseries import GRANULARITIES, stream_timeseries
+from ..heatmap import year_heatmap, heatmap_weeks, valid_year
+from ..http_cache import conditional_on_data_version
+from ..pagination import request_page
 from flask_login import current_user
-from sqlalchemy.orm import aliased
-from .. import db
 
 # creating blueprint for analytics module.
 analytics_bp = Blueprint('analytics', __name__, url_prefix='/analytics')
@@ -24,115 +32,136 @@ class AnalyticsService:
         return Habit.query.filter_by(periodicity=periodicity, user_id=user_id).all()
 
     @staticmethod
-    def get_longest_streak_all_habits():
-        # Calculates and retrieves the longest streak among all habits of current user.
-        habit_streaks = {}
-        longest_streak = 0
-        habits = Habit.query.filter_by(user_id=current_user.id).all()
+    @cached_per_user
+    def get_habit_stats(user_id, periodicity=None, habit_ids=None):
+        # Retrieves name, periodicity, completion count and longest streak of the user's habits,
+        # or of the habits with the given ids (a tuple).
+        # Fresh precomputed stats are used when available, otherwise they are computed with a single
+        # aggregated query. Results are cached until the user's data changes.
+        max_age = timedelta(seconds=current_app.config['ANALYTICS_STATS_MAX_AGE'])
+        stats = fresh_habit_stats(user_id, periodicity, max_age, habit_ids)
+        if stats is not None:
+            return stats
+        return habit_stats(user_id, periodicity, habit_ids)
+
+    @staticmethod
+    @cached_per_user
+    def get_longest_streaks(user_id):
+        # Retrieves the longest streak of every habit of the user, keyed by habit id.
+        # Results are cached until the user's data changes.
+        return longest_streaks(user_id)
 
-        for habit in habits:
-            current_streak = AnalyticsService.calculate_longest_streak(habit.id)
-            habit_streaks[habit] = current_streak
-            if current_streak > longest_streak:
-                longest_streak = current_streak
+    @staticmethod
+    def get_longest_streak(user_id):
+        # Retrieves the longest streak among all habits of the user from the maintained streak columns.
+        return db.session.execute(
+            db.select(func.max(Habit.longest_streak)).where(Habit.user_id == user_id)).scalar() or 0
 
-        habits_with_longest_streak = [habit for habit, streak in habit_streaks.items() if streak == longest_streak]
+    @staticmethod
+    def get_longest_streak_all_habits(user_id=None):
+        # Calculates and retrieves the longest streak among all habits of current user.
+        # The habits are returned as the stats rows of get_habit_stats.
+        if user_id is None:
+            user_id = current_user.id
+        habits = AnalyticsService.get_habit_stats(user_id)
+        longest_streak = max((habit['longest_streak'] for habit in habits), default=0)
+
+        habits_with_longest_streak = [habit for habit in habits if habit['longest_streak'] == longest_streak]
 
         return habits_with_longest_streak, longest_streak
 
     @staticmethod
     def calculate_longest_streak(habit_id):
-        habit_alias = aliased(Habit)
-        completions = db.session.query(Completion).join(
-            habit_alias, habit_alias.id == Completion.habit_id
-        ).filter(
-            habit_alias.id == habit_id
-        ).order_by(Completion.completed_at).all()
-
-        if not completions:
-            return 0
-        dates = [completion.completed_at.date() for completion in completions]
-        streaks = [len(list(group)) for _, group in groupby(enumerate(dates), lambda ix: ix[0] - ix[1].toordinal())]
-        return max(streaks, default=0)
+        # Calculates the longest streak of a habit. Completions are mapped to the periods of the habit,
+        # so duplicates on the same day count once and weekly habits are scored per week.
+        return longest_streak_for_habit(habit_id)
 
 
 @analytics_bp.route('/')
 @login_required
+@conditional_on_data_version()
 def index():
     # Index route for analytics module.
     # Shows overview of analytical functions.
     return render_template('analytics/index.html')
 
 
+def habit_stats_page(stmt, periodicity=None):
+    # Helper function returning one page of the habits selected by stmt, in the order of creation, as the
+    # stats rows of get_habit_stats, and the cursor of the next page. Stats are computed for that page only.
+    habits, next_cursor = request_page(stmt, (Habit.created_at, Habit.id))
+    stats = AnalyticsService.get_habit_stats(current_user.id, periodicity, tuple(habit.id for habit in habits))
+    stats_by_id = {row['id']: row for row in stats}
+    return [stats_by_id[habit.id] for habit in habits if habit.id in stats_by_id], next_cursor
+
+
 @analytics_bp.route('/all_habits')
 @login_required
+@conditional_on_data_version()
 def all_habits():
-    # Route to display the list of all habits for the current user.
-    habits = AnalyticsService.get_habits(current_user.id)
-    habits_details = [{
-        'name': habit.name,
-        'description': habit.description,
-        'periodicity': habit.periodicity,
-        'completions_count': get_completions_count(habit.id),
-        'longest_streak': AnalyticsService.calculate_longest_streak(habit.id)
-    } for habit in habits]
-
-    return render_template('analytics/all_habits.html', all_habits_details=habits_details)
+    # Route to display the list of all habits for the current user, one page at a time.
+    habits_details, next_cursor = habit_stats_page(db.select(Habit).where(Habit.user_id == current_user.id))
+    return render_template('analytics/all_habits.html', all_habits_details=habits_details, next_cursor=next_cursor)
 
 
 @analytics_bp.route('/habits_by_periodicity', methods=['GET', 'POST'])
 @login_required
+@conditional_on_data_version(hourly=True)
 def habits_by_periodicity():
     # Route to filter habits by their periodicity. (daily or weekly)
+    # The submitted form redirects to the filtered list, which is shown one page at a time.
     form = FilterPeriodicityForm()
 
     # This will handle the form submission and validate it
     if request.method == 'POST' and form.validate_on_submit():
-        periodicity = form.periodicity.data
-        user_id = current_user.id
-        # Validate if the periodicity is one of the acceptable values
-        if periodicity not in ['daily', 'weekly']:
-            flash('Invalid periodicity selected', 'error')
-            return redirect(url_for('analytics.index'))
-
-        habits = AnalyticsService.get_habits_by_periodicity(periodicity, user_id)
-        habits_details = [{
-            'name': habit.name,
-            'description': habit.description,
-            'periodicity': habit.periodicity,
-            'completions_count': get_completions_count(habit.id),
-            'longest_streak': AnalyticsService.calculate_longest_streak(habit.id)
-        } for habit in habits]
-
-        return render_template('analytics/habits_by_periodicity.html',
-                               habits_details=habits_details,
-                               periodicity=periodicity,
-                               form=form)
-
-    # For GET requests or if form is not validated, just show the form
-    return render_template('analytics/habits_by_periodicity.html', form=form)
+        return redirect(url_for('analytics.habits_by_periodicity', periodicity=form.periodicity.data))
+
+    periodicity = request.args.get('periodicity')
+    if periodicity is None:
+        # For GET requests without a filter or if form is not validated, just show the form
+        return render_template('analytics/habits_by_periodicity.html', form=form)
+    # Validate if the periodicity is one of the acceptable values
+    if periodicity not in ['daily', 'weekly']:
+        flash('Invalid periodicity selected', 'error')
+        return redirect(url_for('analytics.index'))
+
+    form.periodicity.data = periodicity
+    habits_details, next_cursor = habit_stats_page(
+        db.select(Habit).where(Habit.user_id == current_user.id, Habit.periodicity == periodicity), periodicity)
+    return render_template('analytics/habits_by_periodicity.html',
+                           habits_details=habits_details,
+                           periodicity=periodicity,
+                           next_cursor=next_cursor,
+                           form=form)
 
 
 def get_completions_count(habit_id):
     # Helper function to get the completion count for a specific habit.
-    return Completion.query.filter_by(habit_id=habit_id).count()
+    habit = db.session.get(Habit, habit_id)
+    return habit.completed_count or 0 if habit is not None else 0
 
 
 @analytics_bp.route('/longest_streak_all_habits')
 @login_required
+@conditional_on_data_version()
 def longest_streak_all_habits():
-    # Route to display the habits with the longest completion streaks.
-    habits, longest_streak = AnalyticsService.get_longest_streak_all_habits()
-    return render_template('analytics/longest_streak_all_habits.html', habits=habits, longest_streak=longest_streak)
+    # Route to display the habits with the longest completion streaks, one page at a time.
+    longest_streak = AnalyticsService.get_longest_streak(current_user.id)
+    habits, next_cursor = habit_stats_page(db.select(Habit).where(
+        Habit.user_id == current_user.id, Habit.longest_streak == longest_streak))
+    return render_template('analytics/longest_streak_all_habits.html', habits=habits, longest_streak=longest_streak,
+                           next_cursor=next_cursor)
 
 
 @analytics_bp.route('/longest_streak_for_a_given_habit/<int:habit_id>', methods=['GET', 'POST'])
 @login_required
+@conditional_on_data_version(hourly=True)
 def longest_streak_for_a_given_habit(habit_id):
     # Route to calculate and display the longest streak for a specific habit.
     current_app.logger.info('Calculating longest streak for habit ID: {}'.format(habit_id))
-    habit = Habit.query.get_or_404(habit_id)
-    longest_streak = AnalyticsService.calculate_longest_streak(habit.id)
+    habit = Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
+    # The longest run of completed periods is read from the habit's completion bitmap, without a query.
+    longest_streak = habit.bitmap_longest_streak
     current_app.logger.info('Calculated longest streak: {}'.format(longest_streak))
 
     form = SelectHabitForm()
@@ -154,6 +183,7 @@ def filter_habits():
 
 @analytics_bp.route('/select_habit_for_streak', methods=['GET', 'POST'])
 @login_required
+@conditional_on_data_version(hourly=True)
 def select_habit_for_streak():
     # Route to select a specific habit for viewing its longest streak.
     form = SelectHabitForm()
@@ -162,3 +192,60 @@ def select_habit_for_streak():
         habit_id = form.habit_id.data
         return redirect(url_for('analytics.longest_streak_for_a_given_habit', habit_id=habit_id))
     return render_template('analytics/longest_streak_for_habit.html', form=form)
+
+
+@analytics_bp.route('/cache_stats')
+@login_required
+def cache_stats():
+    # Route reporting the hit/miss counters of the analytics cache of this worker process.
+    return jsonify(analytics_cache.stats())
+
+
+@analytics_bp.route('/timeseries')
+@login_required
+def timeseries():
+    # Route returning per-habit completion counts and rates bucketed by day, week or month
+    # for a date range (default: the last 90 days). The JSON document is streamed.
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify(error='Invalid granularity: ' + granularity), 400
+    try:
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else date.today()
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else end - timedelta(days=89)
+    except ValueError:
+        return jsonify(error='Dates must use the YYYY-MM-DD format'), 400
+    if start > end:
+        return jsonify(error='The start date must not be after the end date'), 400
+    max_days = current_app.config['TIMESERIES_MAX_DAYS']
+    if (end - start).days >= max_days:
+        return jsonify(error='The date range must not span more than {} days'.format(max_days)), 400
+
+    habit_ids = request.args.getlist('habit_id', type=int)
+    chunks = stream_timeseries(current_user.id, start, end, granularity, habit_ids)
+    return Response(stream_with_context(chunks), mimetype='application/json')
+
+
+@analytics_bp.route('/heatmap')
+@login_required
+@conditional_on_data_version()
+def heatmap():
+    # Route displaying a year-at-a-glance heatmap across all habits of the current user.
+    # Unchanged data is answered with 304 Not Modified before any query runs.
+    year = request.args.get('year', default=date.today().year, type=int)
+    if not valid_year(year):
+        abort(400)
+    data = year_heatmap(current_user.id, year)
+    return render_template('analytics/heatmap.html', heatmap=data, weeks=heatmap_weeks(data), year=year,
+                           min_year=MINYEAR, max_year=MAXYEAR)
+
+
+@analytics_bp.route('/heatmap.json')
+@login_required
+@conditional_on_data_version()
+def heatmap_data():
+    # Route returning the habits x days matrix of a year as JSON, one day bitstring per habit.
+    # Unchanged data is answered with 304 Not Modified before any query runs.
+    year = request.args.get('year', default=date.today().year, type=int)
+    if not valid_year(year):
+        return jsonify(error='Invalid year: {}'.format(year)), 400
+    return jsonify(year_heatmap(current_user.id, year))
@@ -1,26 +1,102 @@
-from datetime import datetime, timedelta
-from ..models import Completion
-from typing import List, Tuple, Optional
+from calendar import monthrange
+from datetime import date, timedelta
+from ..models import DailyCompletion, Habit
+from typing import List, Tuple, Optional, Set
 from .. import db
 
 
-def generate_calendar(year: int, month: int, habit_id: int) -> Tuple[List[Tuple[int, int, Optional[bool]]], int]:
-    # Create the start date of the month
-    start_date = datetime(year, month, 1)
-    # Compute the last date of the month in a more straightforward way
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    # Returns the first and the last date of a month.
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def shift_month(year: int, month: int, offset: int) -> Tuple[int, int]:
+    # Returns the year and month lying offset months after (or before) the given month.
+    index = year * 12 + month - 1 + offset
+    return index // 12, index % 12 + 1
+
 
+def completed_days(habit_id: int, start_date: date, end_date: date) -> Set[date]:
+    # Returns the days between start_date and end_date with at least one completion.
+    # Daily habits keep one bit per day, so their days are a slice of the completion bitmap.
+    # Other habits, and habits whose bitmap was never built, are looked up with a single range query
+    # on the (habit_id, day) key of the rollup.
+    habit = db.session.get(Habit, habit_id)
+    if habit is not None and habit.periodicity == 'daily' and habit.completion_bitmap is not None:
+        flags = habit.completed_periods(start_date, end_date)
+        return {start_date + timedelta(days=index) for index, flag in enumerate(flags) if flag}
+
+    return set(db.session.execute(
+        db.select(DailyCompletion.day).where(
+            DailyCompletion.habit_id == habit_id,
+            DailyCompletion.day >= start_date,
+            DailyCompletion.day <= end_date
+        )
+    ).scalars())
+
+
+def build_month(year: int, month: int, days_done: Set[date]) -> List[Tuple[int, int, Optional[bool]]]:
+    # Builds the (day, weekday, completed) list of a month from a set of completed days.
+    start_date, end_date = month_bounds(year, month)
     days = []
-    # Generate each day of the month
-    for single_date in (start_date + timedelta(n) for n in range((end_date - start_date).days + 1)):
-        # Check if there's a completion record for this date
-        completed = Completion.query.filter((Completion.habit_id == habit_id) & (
-                db.func.date(Completion.completed_at) == single_date.date())).first() is not None
+    for n in range((end_date - start_date).days + 1):
+        single_date = start_date + timedelta(days=n)
+        days.append((single_date.day, single_date.weekday(), single_date in days_done))
+    return days
+
 
-        days.append((single_date.day, single_date.weekday(), completed))
+def generate_calendars(year: int, month: int, habit_id: int,
+                       count: int = 1) -> List[Tuple[int, int, List[Tuple[int, int, Optional[bool]]]]]:
+    # Generates count consecutive months starting with the given one from a single lookup of the
+    # completed days, e.g. to prefetch the months around the displayed one.
+    # Returns a (year, month, days) tuple per month.
+    last_year, last_month = shift_month(year, month, count - 1)
+    days_done = completed_days(habit_id, month_bounds(year, month)[0], month_bounds(last_year, last_month)[1])
 
+    months = []
+    for offset in range(count):
+        month_year, month_number = shift_month(year, month, offset)
+        months.append((month_year, month_number, build_month(month_year, month_number, days_done)))
+    return months
+
+
+def generate_calendar(year: int, month: int, habit_id: int) -> Tuple[List[Tuple[int, int, Optional[bool]]], int]:
+    # Generates the (day, weekday, completed) list of a single month.
+    _, _, days = generate_calendars(year, month, habit_id)[0]
     len_days = len(days)
     return days, len_days
+
+
+def day_statuses(habit: Habit, year: int, month: int,
+                 today: Optional[date] = None) -> List[Tuple[int, int, Optional[str]]]:
+    # Classifies every day of a month for the calendar template, returning (day, weekday, status) tuples.
+    # Status is 'future' after today, 'completed' for days in a period with a completion,
+    # 'broken' for the last day of a missed period that is over, and None (neutral) otherwise:
+    # days before the habit was created and days of the current period that is not completed yet.
+    today = today or date.today()
+    start_date, end_date = month_bounds(year, month)
+    created = habit.created_at.date() if habit.created_at is not None else today
+
+    # Look up whole periods, so weekly periods overlapping the month boundaries are classified correctly.
+    first_period, last_period = habit.period_of(start_date), habit.period_of(end_date)
+    range_start = habit.period_start(first_period)
+    range_end = habit.period_start(last_period + 1) - timedelta(days=1)
+    done = {habit.period_of(day) for day in completed_days(habit.id, range_start, range_end)}
+    today_period = habit.period_of(today)
+
+    statuses = []
+    for n in range((end_date - start_date).days + 1):
+        single_date = start_date + timedelta(days=n)
+        period = habit.period_of(single_date)
+        if single_date > today:
+            status = 'future'
+        elif period in done:
+            status = 'completed'
+        elif single_date < created or period == today_period:
+            status = None
+        elif single_date == habit.period_start(period + 1) - timedelta(days=1):
+            status = 'broken'
+        else:
+            status = None
+        statuses.append((single_date.day, single_date.weekday(), status))
+    return statuses
@@ -1,11 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, Response
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
 from ..models import Habit, db, Completion
 from ..forms import CustomHabitForm, PredefinedHabitForm
-from .calendar import generate_calendar
+from .calendar import generate_calendars, day_statuses, shift_month
+from ..http_cache import conditional_on_data_version
+from ..completions import bulk_complete, complete_habit
+from ..pagination import request_page
+from ..deletion import delete_habits
+from ..sync import apply_batch
+from ..changes import changes_since
+import json
 from logging import getLogger
-from datetime import date, timedelta
+from datetime import date, timedelta, MINYEAR, MAXYEAR
 
 logger = getLogger(__name__)
 
@@ -23,32 +30,29 @@ habit_bp = Blueprint('habit', __name__, url_prefix='/habits')
 
 @habit_bp.route('/')
 @login_required
+@conditional_on_data_version()
 def index():
     # Route for showing all habits of the currently logged-in user.
     # Offering an option to filter out habits which have been completed.
+    # Habits are listed one page at a time in the order they were created.
     show_completed = request.args.get('show_completed', 'True') == 'True'
-    if show_completed:
-        habits = Habit.query.filter_by(user_id=current_user.id).all()
-    else:
-        habits = Habit.query.filter_by(user_id=current_user.id, completed=False).all()
+    stmt = db.select(Habit).filter_by(user_id=current_user.id)
+    if not show_completed:
+        stmt = stmt.filter_by(completed=False)
+    habits, next_cursor = request_page(stmt, (Habit.created_at, Habit.id))
 
-    if not habits:
+    if not habits and 'cursor' not in request.args:
         return redirect(url_for('habit.add_habit'))
 
-    habits_data = []
-    for habit in habits:
-        completions_count = habit.completions.count()
-        habits_data.append({
-            'habit': habit,
-            'completions_count': completions_count
-        })
+    # The completion counts are maintained on the habit rows, so the list needs no further queries.
+    habits_data = [{'habit': habit, 'completions_count': habit.completed_count or 0} for habit in habits]
 
     custom_habit_form = CustomHabitForm()
     predefined_habit_form = PredefinedHabitForm()
     predefined_habit_form.predefined_habit_name.choices = [(habit[0], habit[0]) for habit in DEFAULT_HABITS]
     return render_template('habit/list.html', habits_data=habits_data, custom_habit_form=custom_habit_form,
                            predefined_habit_form=predefined_habit_form, default_habits=DEFAULT_HABITS,
-                           show_completed=show_completed)
+                           show_completed=show_completed, next_cursor=next_cursor)
 
 
 @habit_bp.route('/add', methods=['GET', 'POST'])
@@ -100,23 +104,34 @@ def edit_habit(habit_id):
 @habit_bp.route('/delete/<int:habit_id>', methods=['POST'])
 @login_required
 def delete_habit(habit_id):
-    # Route for deleting an existing habit.
+    # Route for deleting an existing habit with its completions, reminders and statistics.
     habit = Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
-    db.session.delete(habit)
+    delete_habits(current_user.id, [habit.id], current_app.config['DELETE_CHUNK_SIZE'])
     db.session.commit()
     flash('Habit deleted!')
     return redirect(url_for('habit.index'))
 
 
+@habit_bp.route('/delete', methods=['POST'])
+@login_required
+def delete_selected_habits():
+    # Route for deleting all habits selected in the habit list at once.
+    habit_ids = request.form.getlist('habit_id', type=int)
+    deleted = delete_habits(current_user.id, habit_ids, current_app.config['DELETE_CHUNK_SIZE'])
+    db.session.commit()
+    flash('{} habits deleted!'.format(len(deleted)) if deleted else 'No habits selected.')
+    return redirect(url_for('habit.index'))
+
+
 @habit_bp.route('/complete/<int:habit_id>', methods=['POST'])
 @login_required
 def mark_completed(habit_id):
     # Route for marking an existing habit as completed.
-    # Generates a timestamp to mark the completion time.
+    # Generates a timestamp to mark the completion time. Completing a habit again on the same day
+    # increments the count of the day's completion.
     habit = Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
-    completion = Completion(completed_at=date.today(), habit_id=habit.id)
-    db.session.add(completion)
     try:
+        complete_habit(habit, date.today())
         db.session.commit()
         flash('Habit marked as completed!', 'success')
     except SQLAlchemyError as e:
@@ -125,10 +140,93 @@ def mark_completed(habit_id):
     return redirect(url_for('habit.index'))
 
 
+@habit_bp.route('/<int:habit_id>/history')
+@login_required
+@conditional_on_data_version()
+def completion_history(habit_id):
+    # Route listing the completions of a habit, newest first, one page at a time.
+    habit = Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
+    completions, next_cursor = request_page(db.select(Completion).filter_by(habit_id=habit.id),
+                                            (Completion.day, Completion.id), descending=True)
+    return render_template('habit/history.html', habit=habit, completions=completions, next_cursor=next_cursor)
+
+
+@habit_bp.route('/completions/bulk', methods=['POST'])
+@login_required
+def bulk_completions():
+    # Route recording many completions at once, e.g. to catch up after a trip.
+    # Expects a JSON body {"completions": [{"habit_id": 1, "date": "2024-05-01"}, ...]} and returns
+    # a result per item. All completions are written in a single transaction.
+    payload = request.get_json(silent=True)
+    items = payload.get('completions') if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return jsonify(error='Expected a JSON object with a list of completions'), 400
+    if len(items) > current_app.config['BULK_COMPLETIONS_MAX_ITEMS']:
+        return jsonify(error='At most {} completions per request'.format(
+            current_app.config['BULK_COMPLETIONS_MAX_ITEMS'])), 413
+
+    try:
+        results = bulk_complete(current_user.id, items)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error('Error recording bulk completions: {}'.format(e))
+        return jsonify(error='The completions could not be recorded'), 500
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify(results=results, summary=summary)
+
+
+@habit_bp.route('/sync', methods=['POST'])
+@login_required
+def sync_completions():
+    # Route applying the completions a mobile client queued while offline.
+    # Expects an NDJSON body with one {"key": "...", "habit_id": 1, "completed_at": "2024-05-01T07:30:00+02:00"}
+    # object per line and streams back one {"i": 0, "key": "...", "status": "created"} line per item.
+    # The batch is applied in a single transaction; keys that were applied before are reported as duplicates,
+    # so a client can resend a batch whose response it never received.
+    lines = [line for line in request.get_data().splitlines() if line.strip()]
+    if len(lines) > current_app.config['BULK_COMPLETIONS_MAX_ITEMS']:
+        return jsonify(error='At most {} completions per request'.format(
+            current_app.config['BULK_COMPLETIONS_MAX_ITEMS'])), 413
+
+    try:
+        results = apply_batch(current_user.id, lines)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error('Error syncing completions: {}'.format(e))
+        return jsonify(error='The completions could not be synced'), 500
+
+    def generate():
+        for result in results:
+            yield json.dumps(result, separators=(',', ':')) + '\n'
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@habit_bp.route('/changes')
+@login_required
+@conditional_on_data_version()
+def changes():
+    # Route serving the habits, completions and reminders changed since the cursor of the client's last
+    # refresh, and tombstones for the deleted ones. Without a cursor, everything is returned. The response
+    # carries the cursor to send with the next refresh.
+    cursor = request.args.get('cursor', type=int)
+    if cursor is None and 'cursor' in request.args:
+        return jsonify(error='The cursor must be an integer'), 400
+    try:
+        return jsonify(changes_since(current_user.id, cursor))
+    except ValueError:
+        return jsonify(error='The cursor is ahead of the data'), 400
+
+
 @habit_bp.route('/<int:habit_id>/calendar', methods=['POST', 'GET'])
 @login_required
+@conditional_on_data_version()
 def habit_calendar(habit_id):
-    habit = Habit.query.get_or_404(habit_id)
+    habit = Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
 
     # Get the current date.
     today = date.today()
@@ -137,12 +235,16 @@ def habit_calendar(habit_id):
     year = int(request.args.get('year', default=today.year))
     month = int(request.args.get('month', default=today.month))
 
-    # Generate calendar data for the selected month and year.
-    days, len_days = generate_calendar(year, month, habit_id)
+    # Classify every day of the selected month for the template.
+    days = day_statuses(habit, year, month, today)
+    len_days = len(days)
 
     # Calculate the length.
     days_length = len(days)
 
+    # The calendar starts on Sunday, while weekday() counts from Monday.
+    leading_blanks = (days[0][1] + 1) % 7
+
     # Calculate dates for previous and next months.
     prev_month = date(year, month, 1) - timedelta(days=1)
     next_month = date(year, month, 1) + timedelta(days=32)
@@ -155,6 +257,7 @@ def habit_calendar(habit_id):
         days=days,
         len_days=len_days,
         days_length=days_length,
+        leading_blanks=leading_blanks,
         current_month=date(year, month, 1).strftime('%B %Y'),
         year=year,
         month=month,
@@ -162,3 +265,28 @@ def habit_calendar(habit_id):
         prev_month=prev_month,
         next_month=next_month,
     )
+
+
+@habit_bp.route('/<int:habit_id>/calendar/months')
+@login_required
+@conditional_on_data_version()
+def calendar_months(habit_id):
+    # Route returning up to 12 consecutive months of a habit calendar as JSON, starting with the given
+    # month (default: the month before the current one, so prev/current/next come in one request).
+    habit = Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
+    today = date.today()
+    default = date(today.year, today.month, 1) - timedelta(days=1)
+    year = request.args.get('year', default=default.year, type=int)
+    month = request.args.get('month', default=default.month, type=int)
+    count = min(max(request.args.get('count', default=3, type=int), 1), 12)
+    if not 1 <= month <= 12:
+        return jsonify(error='Invalid month'), 400
+    if year < MINYEAR or shift_month(year, month, count - 1)[0] > MAXYEAR:
+        return jsonify(error='The months must lie between the years {} and {}'.format(MINYEAR, MAXYEAR)), 400
+
+    months = generate_calendars(year, month, habit.id, count)
+    return jsonify(months=[{
+        'year': month_year,
+        'month': month_number,
+        'days': [{'day': day, 'weekday': weekday, 'completed': completed} for day, weekday, completed in days]
+    } for month_year, month_number, days in months])
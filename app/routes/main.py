@@ -1,18 +1,50 @@
-from flask import Blueprint, render_template
+import weakref
+from flask import Blueprint, render_template, make_response, current_app, session
+from flask_login import current_user
 from datetime import datetime
-from ..models import Reminder
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, or_
+from sqlalchemy.orm import contains_eager
+from ..models import db, Reminder, Habit
+from ..http_cache import conditional_on_data_version
 
 # Define the Blueprint.
 main_bp = Blueprint('main', __name__, url_prefix='')
 
+# The landing page of anonymous visitors, rendered once per application.
+_landing_pages = weakref.WeakKeyDictionary()
+
 
 @main_bp.route('/', methods=['GET'])
+@conditional_on_data_version()
 def index():
+    if not current_user.is_authenticated and not session.get('_flashes'):
+        return landing_page()
+
     current_date = datetime.now().date()  # Get the current date.
 
-    # Query for reminders that are due today, and their corresponding habits.
-    due_reminders = Reminder.query.options(joinedload(Reminder.habit)).filter_by(date=current_date).all()
+    # Query for the user's reminder rules that may occur today, and their corresponding habits, and keep
+    # those occurring today. The join reads the user's habits by user_id and their reminders by (habit_id, date).
+    candidates = db.session.execute(
+        select(Reminder).join(Reminder.habit).options(contains_eager(Reminder.habit))
+        .where(Habit.user_id == current_user.id, Reminder.date <= current_date,
+               or_(Reminder.recurrence.is_not(None), Reminder.date == current_date),
+               or_(Reminder.until.is_(None), Reminder.until >= current_date))
+        .order_by(Reminder.id)
+    ).scalars().all()
+    due_reminders = [reminder for reminder in candidates if reminder.occurs_on(current_date)]
 
     # Pass the reminders to the template.
     return render_template('index.html', reminders=due_reminders)
+
+
+def landing_page():
+    # The page of anonymous visitors depends on no data, so it is served from memory without a query.
+    # Shared caches may keep it as well; they vary it by cookie, as logged-in users get their own page.
+    app = current_app._get_current_object()
+    if app not in _landing_pages:
+        _landing_pages[app] = render_template('index.html', reminders=[])
+    response = make_response(_landing_pages[app])
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['LANDING_PAGE_MAX_AGE']
+    response.vary.add('Cookie')
+    return response
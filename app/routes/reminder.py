@@ -1,7 +1,9 @@
 from flask import Blueprint, request, redirect, url_for, render_template, flash
 from flask_login import login_required, current_user
 from ..models import Reminder, Habit, db
-from datetime import datetime
+from ..pagination import request_page
+from ..recurrence import RECURRENCES, WEEKDAY_NAMES, weekday_mask
+from datetime import datetime, date
 
 # Creating a blueprint for the reminder module.
 reminder_bp = Blueprint('reminder', __name__, url_prefix='/reminders')
@@ -10,10 +12,34 @@ reminder_bp = Blueprint('reminder', __name__, url_prefix='/reminders')
 @reminder_bp.route('/')
 @login_required
 def index():
-    # Route for displaying all reminders of the current user.
+    # Route for displaying the reminders of the current user by date, one page at a time.
     # Redirects to the index page of the reminders.
-    reminders = Reminder.query.join(Habit).filter(Habit.user_id == current_user.id).all()
-    return render_template('reminder/index.html', reminders=reminders)
+    # Every row is a rule, listed by its first date together with its next occurrence.
+    stmt = db.select(Reminder).join(Habit).where(Habit.user_id == current_user.id)
+    reminders, next_cursor = request_page(stmt, (Reminder.date, Reminder.id))
+    return render_template('reminder/index.html', reminders=reminders, next_cursor=next_cursor, today=date.today())
+
+
+def schedule_from_form(form, first: date) -> dict:
+    # Reads the recurrence fields of the add and edit forms into Reminder columns.
+    # Raises ValueError with a message for the user if they do not describe a valid rule.
+    recurrence = form.get('recurrence') or None
+    if recurrence is not None and recurrence not in RECURRENCES:
+        raise ValueError('Invalid recurrence.')
+    weekdays = interval_days = until = None
+    if recurrence == 'weekly':
+        weekdays = weekday_mask(int(weekday) for weekday in form.getlist('weekday'))
+        if not weekdays:
+            raise ValueError('Please select at least one weekday.')
+    elif recurrence == 'interval':
+        interval_days = int(form.get('interval_days') or 0)
+        if interval_days < 1:
+            raise ValueError('Please enter the number of days between reminders.')
+    if recurrence is not None and form.get('until'):
+        until = datetime.strptime(form.get('until'), '%Y-%m-%d').date()
+        if until < first:
+            raise ValueError('The last date must not lie before the first date.')
+    return {'recurrence': recurrence, 'weekdays': weekdays, 'interval_days': interval_days, 'until': until}
 
 
 @reminder_bp.route('/add', methods=['GET', 'POST'])
@@ -36,14 +62,21 @@ def add_reminder():
             flash('Please select a date.', 'error')
         else:
             date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-            new_reminder = Reminder(date=date_obj, message=message, habit_id=habit_id)
+            try:
+                schedule = schedule_from_form(request.form, date_obj)
+            except ValueError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('reminder.index'))
+            new_reminder = Reminder(date=date_obj, message=message, habit_id=habit_id, **schedule)
+            # Occurrences before today are not delivered.
+            new_reminder.reschedule(date.today())
             db.session.add(new_reminder)
             db.session.commit()
             flash('New reminder added!')
 
         return redirect(url_for('reminder.index'))
 
-    return render_template('reminder/add.html', habits=habits)
+    return render_template('reminder/add.html', habits=habits, weekday_names=WEEKDAY_NAMES)
 
 
 @reminder_bp.route('/edit/<int:reminder_id>', methods=['GET', 'POST'])
@@ -59,13 +92,23 @@ def edit_reminder(reminder_id):
 
     if request.method == 'POST':
         # Convert the date from a string to a datetime.date
-        reminder.date = datetime.strptime(request.form.get('date'), '%Y-%m-%d').date()
+        date_obj = datetime.strptime(request.form.get('date'), '%Y-%m-%d').date()
+        try:
+            schedule = schedule_from_form(request.form, date_obj)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('reminder.edit_reminder', reminder_id=reminder.id))
+        reminder.date = date_obj
         reminder.message = request.form.get('message')
+        for column, value in schedule.items():
+            setattr(reminder, column, value)
+        # The dispatcher continues with the next occurrence of the changed rule.
+        reminder.reschedule(date.today())
         db.session.commit()
         flash('Reminder updated successfully!')
         return redirect(url_for('reminder.index'))
 
-    return render_template('reminder/edit.html', reminder=reminder)
+    return render_template('reminder/edit.html', reminder=reminder, weekday_names=WEEKDAY_NAMES)
 
 
 @reminder_bp.route('/delete/<int:reminder_id>', methods=['POST'])
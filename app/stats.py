@@ -0,0 +1,58 @@
+from typing import List, Optional, Sequence
+
+from sqlalchemy import select, func
+
+from .extensions import db
+from .models import Habit
+from .streaks import longest_streak_statement, longest_streaks, supports_window_functions
+
+
+# Aggregated per-habit statistics for the analytics pages.
+# Completion counts are read from the habit rows and joined with the window-function streaks,
+# so the stats of all selected habits come back in one query however many habits a user has.
+
+
+def habit_stats_statement(user_id: int, periodicity: Optional[str] = None, with_streaks: bool = True,
+                          habit_ids: Optional[Sequence[int]] = None):
+    # Builds the statement returning one row per selected habit with its completion count,
+    # read from the maintained counter column, and, if requested, its longest streak.
+    # Habits are selected by user, and optionally by periodicity and id.
+    stmt = select(
+        Habit.id, Habit.name, Habit.description, Habit.periodicity,
+        func.coalesce(Habit.completed_count, 0).label('completions_count')
+    )
+
+    if with_streaks:
+        streaks = longest_streak_statement(user_id, habit_ids).subquery()
+        habit_id_column, streak_column = streaks.c
+        stmt = stmt.add_columns(func.coalesce(streak_column, 0).label('longest_streak')).outerjoin(
+            streaks, habit_id_column == Habit.id)
+
+    stmt = stmt.where(Habit.user_id == user_id)
+    if periodicity is not None:
+        stmt = stmt.where(Habit.periodicity == periodicity)
+    if habit_ids is not None:
+        stmt = stmt.where(Habit.id.in_(habit_ids))
+    return stmt.order_by(Habit.id)
+
+
+def with_completion_rates(rows: List[dict]) -> List[dict]:
+    # Adds the period completion rate of every habit, counted in the completion bitmaps of the habits.
+    habits = {habit.id: habit for habit in db.session.execute(
+        select(Habit).where(Habit.id.in_([row['id'] for row in rows]))).scalars()} if rows else {}
+    return [dict(row, completion_rate=habits[row['id']].completion_rate()) for row in rows]
+
+
+def habit_stats(user_id: int, periodicity: Optional[str] = None,
+                habit_ids: Optional[Sequence[int]] = None) -> List[dict]:
+    # Returns name, description, periodicity, completion count, longest streak and completion rate of every
+    # habit of the user, optionally restricted to one periodicity or to the given habits.
+    if supports_window_functions(db.engine):
+        rows = db.session.execute(habit_stats_statement(user_id, periodicity, habit_ids=habit_ids)).mappings().all()
+        return with_completion_rates([dict(row) for row in rows])
+
+    # Without window functions the streaks come from the NumPy engine in a second query.
+    rows = db.session.execute(
+        habit_stats_statement(user_id, periodicity, with_streaks=False, habit_ids=habit_ids)).mappings().all()
+    streaks = longest_streaks(user_id, habit_ids)
+    return with_completion_rates([dict(row, longest_streak=streaks.get(row['id'], 0)) for row in rows])
@@ -0,0 +1,181 @@
+import sqlite3
+from itertools import groupby
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import Integer, select, func, case
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from .extensions import db
+from .models import Habit, DailyCompletion
+
+
+# Streak engine working on whole sets of habits at once.
+# Completions are mapped to period ordinals (days for daily habits, weeks starting on the weekday
+# of creation for weekly habits) and deduplicated, so several completions in one period count once.
+# The longest streak of every habit of a user is solved as a "gaps and islands" problem:
+# consecutive periods minus their row number inside the habit stay constant for a run,
+# so grouping on that difference yields the runs and their lengths in a single statement.
+# Without window functions the same runs are found with NumPy array operations.
+# Completion days are read from the indexed daily rollup table rather than the raw completions.
+
+
+class day_number(FunctionElement):
+    # SQL expression turning a date/datetime column into an integer day number.
+    # Only differences between day numbers are meaningful, so each dialect may use its own epoch.
+    type = Integer()
+    name = 'day_number'
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _compile_day_number(element, compiler, **kw):
+    return "(CAST(%s AS DATE) - DATE '1970-01-01')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_number, 'sqlite')
+def _compile_day_number_sqlite(element, compiler, **kw):
+    return 'CAST(julianday(date(%s)) AS INTEGER)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_number, 'mysql')
+def _compile_day_number_mysql(element, compiler, **kw):
+    return 'TO_DAYS(%s)' % compiler.process(element.clauses, **kw)
+
+
+def supports_window_functions(engine) -> bool:
+    # Window functions arrived in SQLite 3.25 and MySQL 8.0 (MariaDB 10.2); other backends have them.
+    dialect = engine.dialect
+    if dialect.name == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    if dialect.name == 'mysql':
+        version = dialect.server_version_info or (0,)
+        minimum = (10, 2) if getattr(dialect, 'is_mariadb', False) else (8, 0)
+        return tuple(version[:2]) >= minimum
+    return True
+
+
+def period_number(completed_on, habit=Habit):
+    # SQL expression mapping a completion date or timestamp to the ordinal of the habit period containing it.
+    # Matches Habit.period_of: weekly periods start on the weekday the habit was created.
+    day = day_number(completed_on)
+    return case(
+        (habit.periodicity == 'weekly', (day - day_number(habit.created_at) % 7) // 7),
+        else_=day
+    )
+
+
+def to_periods(day_numbers, periodicity: str, created_day: int = 0) -> np.ndarray:
+    # Maps day numbers to sorted, deduplicated period ordinals of a habit with the given periodicity.
+    days = np.asarray(day_numbers, dtype=np.int64)
+    if periodicity == 'weekly':
+        days = (days - created_day % 7) // 7
+    return np.unique(days)
+
+
+def longest_run(periods: np.ndarray) -> int:
+    # Length of the longest run of consecutive ordinals in a sorted, deduplicated array.
+    if periods.size == 0:
+        return 0
+    ends = np.flatnonzero(np.diff(periods) != 1)
+    bounds = np.concatenate(([-1], ends, [periods.size - 1]))
+    return int(np.diff(bounds).max())
+
+
+def current_run(periods: np.ndarray) -> int:
+    # Length of the run ending at the last ordinal of a sorted, deduplicated array.
+    if periods.size == 0:
+        return 0
+    ends = np.flatnonzero(np.diff(periods) != 1)
+    return int(periods.size - 1 - ends[-1]) if ends.size else int(periods.size)
+
+
+def longest_runs(period_arrays: Sequence[np.ndarray]) -> np.ndarray:
+    # Batch version of longest_run: takes the sorted, deduplicated ordinal arrays of many habits
+    # and returns the longest run of each, without a Python loop over the ordinals.
+    count = len(period_arrays)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    sizes = np.fromiter((periods.size for periods in period_arrays), dtype=np.int64, count=count)
+    values = np.concatenate(period_arrays).astype(np.int64, copy=False)
+    owners = np.repeat(np.arange(count), sizes)
+
+    # A run starts at every ordinal that does not continue the previous one of the same habit.
+    starts = np.ones(values.size, dtype=bool)
+    starts[1:] = (np.diff(values) != 1) | (np.diff(owners) != 0)
+    run_ids = np.cumsum(starts) - 1
+    run_lengths = np.bincount(run_ids)
+
+    result = np.zeros(count, dtype=np.int64)
+    np.maximum.at(result, owners[starts], run_lengths)
+    return result
+
+
+def longest_streak_statement(user_id: int, habit_ids: Optional[Sequence[int]] = None):
+    # Builds the single statement returning (habit_id, longest_streak) for every habit of the user
+    # (or the given habits of the user) that has at least one completion.
+    periods = select(
+        DailyCompletion.habit_id.label('habit_id'),
+        period_number(DailyCompletion.day).label('period')
+    ).join(Habit, Habit.id == DailyCompletion.habit_id).where(Habit.user_id == user_id)
+    if habit_ids is not None:
+        periods = periods.where(DailyCompletion.habit_id.in_(habit_ids))
+    periods = periods.distinct().subquery()
+
+    islands = select(
+        periods.c.habit_id,
+        (periods.c.period - func.row_number().over(
+            partition_by=periods.c.habit_id, order_by=periods.c.period)).label('island')
+    ).subquery()
+
+    runs = select(
+        islands.c.habit_id,
+        func.count().label('length')
+    ).group_by(islands.c.habit_id, islands.c.island).subquery()
+
+    return select(runs.c.habit_id, func.max(runs.c.length)).group_by(runs.c.habit_id)
+
+
+def _longest_streaks_sql(user_id: int, habit_ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+    return dict(db.session.execute(longest_streak_statement(user_id, habit_ids)).all())
+
+
+def _longest_streaks_numpy(user_id: int, habit_ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+    # Fallback for databases without window functions. Only (habit_id, period) integer pairs are
+    # fetched, so no ORM objects are built even for long histories.
+    stmt = select(DailyCompletion.habit_id, period_number(DailyCompletion.day)).join(
+        Habit, Habit.id == DailyCompletion.habit_id).where(Habit.user_id == user_id)
+    if habit_ids is not None:
+        stmt = stmt.where(DailyCompletion.habit_id.in_(habit_ids))
+    rows = db.session.execute(stmt.order_by(DailyCompletion.habit_id)).all()
+
+    habit_ids, period_arrays = [], []
+    for habit_id, habit_rows in groupby(rows, key=lambda row: row[0]):
+        habit_ids.append(habit_id)
+        period_arrays.append(np.unique(np.fromiter((period for _, period in habit_rows), dtype=np.int64)))
+    return dict(zip(habit_ids, longest_runs(period_arrays).tolist()))
+
+
+def longest_streaks(user_id: int, habit_ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+    # Returns the longest streak of every habit of the user, or of the given habits, in one round trip.
+    # Habits without any completion are left out of the result; callers should default them to 0.
+    if supports_window_functions(db.engine):
+        return _longest_streaks_sql(user_id, habit_ids)
+    return _longest_streaks_numpy(user_id, habit_ids)
+
+
+def habit_periods(habit_id: int) -> np.ndarray:
+    # Fetches the sorted, deduplicated period ordinals of all completions of a habit.
+    periods = db.session.execute(
+        select(period_number(DailyCompletion.day))
+        .select_from(DailyCompletion)
+        .join(Habit, Habit.id == DailyCompletion.habit_id)
+        .where(DailyCompletion.habit_id == habit_id)
+    ).scalars()
+    return np.unique(np.fromiter(periods, dtype=np.int64))
+
+
+def longest_streak_for_habit(habit_id: int) -> int:
+    # Returns the longest streak of a single habit, respecting its periodicity.
+    return longest_run(habit_periods(habit_id))
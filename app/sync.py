@@ -0,0 +1,156 @@
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import select, insert, update, func, tuple_
+from sqlalchemy.dialects import sqlite, postgresql
+
+from .extensions import db
+from .models import Completion, SyncReceipt
+from .rollup import add_completion_days
+from .completions import refresh_habits, parse_habit_id, owned_habits, before_creation
+from .events import next_change_seq
+
+# Offline sync of completions queued by mobile clients.
+# A batch is an NDJSON document with one {"key", "habit_id", "completed_at"} object per line. The key is
+# generated by the client; keys are claimed in the sync_receipt table with INSERT ... ON CONFLICT DO NOTHING,
+# so a replayed batch applies only the items that were not applied before. Every applied item counts as
+# one completion, like a click on mark_completed: a new day creates a completion, a completed day
+# increments its count. The whole batch is applied in the session's transaction.
+
+MAX_KEY_LENGTH = 64
+
+completion_table = Completion.__table__
+receipt_table = SyncReceipt.__table__
+
+
+def parse_batch(lines: Iterable[bytes]) -> Tuple[List[dict], List[Tuple[int, str, int, datetime]]]:
+    # Parses and validates the lines of a batch. Returns a result per non-empty line, with a status for
+    # the invalid ones, and the (index, key, habit_id, completed_at) tuples of the valid ones.
+    latest = date.today() + timedelta(days=1)  # clients may be a time zone ahead of the server
+    results, valid = [], []
+    for line in lines:
+        if not line.strip():
+            continue
+        index = len(results)
+        result = {'i': index}
+        results.append(result)
+        try:
+            item = json.loads(line)
+            key = item['key']
+            habit_id = parse_habit_id(item['habit_id'])
+            completed_at = datetime.fromisoformat(item['completed_at'])
+        except (ValueError, KeyError, TypeError):
+            result['status'] = 'invalid'
+            continue
+        if isinstance(key, str) and key:
+            result['key'] = key
+        if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH or completed_at.date() > latest:
+            result['status'] = 'invalid'
+            continue
+        # The day of a completion is the client's local day, so the client's wall clock time is kept.
+        valid.append((index, key, habit_id, completed_at.replace(tzinfo=None)))
+    return results, valid
+
+
+def _claim_keys(connection, user_id: int, keys: List[str]) -> Set[str]:
+    # Stores the receipts of the keys that were not seen before and returns those keys.
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'key': key, 'created_at': now} for key in keys]
+    dialect = connection.dialect
+    if dialect.name in ('sqlite', 'postgresql') and dialect.insert_executemany_returning:
+        module = sqlite if dialect.name == 'sqlite' else postgresql
+        stmt = module.insert(receipt_table).on_conflict_do_nothing(
+            index_elements=[receipt_table.c.user_id, receipt_table.c.key]).returning(receipt_table.c.key)
+        return set(connection.execute(stmt, rows).scalars())
+
+    seen = set(connection.execute(
+        select(receipt_table.c.key).where(receipt_table.c.user_id == user_id, receipt_table.c.key.in_(keys))
+    ).scalars())
+    rows = [row for row in rows if row['key'] not in seen]
+    if rows:
+        connection.execute(insert(receipt_table), rows)
+    return {row['key'] for row in rows}
+
+
+def _add_completions(connection, counts: Dict[Tuple[int, date], Tuple[int, datetime]],
+                     seq: int) -> Set[Tuple[int, date]]:
+    # Adds count completions per (habit_id, day) pair: inserts the completion of a new day or increments
+    # the count of the existing one, stamping it with the change sequence seq. Returns the pairs that were inserted.
+    rows = [{'habit_id': habit_id, 'day': day, 'completed_at': completed_at, 'count': count, 'change_seq': seq}
+            for (habit_id, day), (count, completed_at) in counts.items()]
+    dialect = connection.dialect
+    if dialect.name in ('sqlite', 'postgresql') and dialect.insert_executemany_returning:
+        module = sqlite if dialect.name == 'sqlite' else postgresql
+        stmt = module.insert(completion_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[completion_table.c.habit_id, completion_table.c.day],
+            set_={'count': func.coalesce(completion_table.c.count, 1) + stmt.excluded['count'], 'change_seq': seq}
+        ).returning(completion_table.c.habit_id, completion_table.c.day, completion_table.c.count)
+        # An inserted row returns exactly the added count, an updated one a larger count.
+        return {(habit_id, day) for habit_id, day, count in connection.execute(stmt, rows)
+                if count == counts[(habit_id, day)][0]}
+
+    existing = set(connection.execute(
+        select(completion_table.c.habit_id, completion_table.c.day).where(
+            tuple_(completion_table.c.habit_id, completion_table.c.day).in_(list(counts)))
+    ).all())
+    for row in rows:
+        if (row['habit_id'], row['day']) in existing:
+            connection.execute(
+                update(completion_table)
+                .where(completion_table.c.habit_id == row['habit_id'], completion_table.c.day == row['day'])
+                .values(count=func.coalesce(completion_table.c.count, 1) + row['count'], change_seq=seq)
+            )
+    inserted = [row for row in rows if (row['habit_id'], row['day']) not in existing]
+    if inserted:
+        connection.execute(insert(completion_table), inserted)
+    return {(row['habit_id'], row['day']) for row in inserted}
+
+
+def apply_batch(user_id: int, lines: Iterable[bytes]) -> List[dict]:
+    # Applies a batch of queued completions for habits of the user and returns a result per item:
+    # 'created' (a new completed day), 'counted' (the day was completed already), 'duplicate' (the key was
+    # applied before), 'not_found' or 'invalid'. The caller commits the session.
+    results, valid = parse_batch(lines)
+    owned = owned_habits(user_id, (habit_id for _, _, habit_id, _ in valid))
+
+    items = []
+    for index, key, habit_id, completed_at in valid:
+        if habit_id not in owned:
+            results[index]['status'] = 'not_found'
+        elif before_creation(owned[habit_id], completed_at.date()):
+            results[index]['status'] = 'invalid'
+        else:
+            items.append((index, key, habit_id, completed_at))
+    if not items:
+        return results
+
+    connection = db.session.connection()
+    claimed = _claim_keys(connection, user_id, list({key for _, key, _, _ in items}))
+    counts, applied = {}, []
+    for index, key, habit_id, completed_at in items:
+        if key not in claimed:
+            results[index]['status'] = 'duplicate'
+            continue
+        # A key repeated within the batch is applied once.
+        claimed.discard(key)
+        pair = (habit_id, completed_at.date())
+        count, first = counts.get(pair, (0, completed_at))
+        counts[pair] = (count + 1, min(first, completed_at))
+        applied.append((index, pair))
+    if not counts:
+        return results
+
+    # Core statements bypass the ORM events, so the completions are stamped with a change sequence here.
+    inserted = _add_completions(connection, counts, next_change_seq(db.session, user_id))
+    add_completion_days(connection, [{'habit_id': habit_id, 'day': day, 'count': count}
+                                     for (habit_id, day), (count, _) in counts.items()])
+    if inserted:
+        refresh_habits(connection, inserted)
+
+    # The first applied item of a new day created it, later items of the day were counted.
+    for index, pair in applied:
+        results[index]['status'] = 'created' if pair in inserted else 'counted'
+        inserted.discard(pair)
+    return results
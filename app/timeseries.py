@@ -0,0 +1,172 @@
+import json
+from datetime import date, timedelta
+from typing import Iterator, Optional, Sequence
+
+from sqlalchemy import Date, select, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from .extensions import db
+from .models import Habit, DailyCompletion
+from .streaks import period_number
+
+# Bucketed completion time series for charting.
+# Counts are grouped per habit and bucket in the database from the daily rollup table and streamed
+# out as JSON row by row, so long ranges across many habits are never materialized as ORM objects.
+# As everywhere else, completions are completed days; check_ins count every time a day was marked completed.
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+class week_start(FunctionElement):
+    # SQL expression for the Monday of the week containing a date.
+    type = Date()
+    name = 'week_start'
+    inherit_cache = True
+
+
+class month_start(FunctionElement):
+    # SQL expression for the first day of the month containing a date.
+    type = Date()
+    name = 'month_start'
+    inherit_cache = True
+
+
+@compiles(week_start)
+def _compile_week_start(element, compiler, **kw):
+    return "CAST(date_trunc('week', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start, 'sqlite')
+def _compile_week_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'weekday 0', '-6 days')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start, 'mysql')
+def _compile_week_start_mysql(element, compiler, **kw):
+    day = compiler.process(element.clauses, **kw)
+    return 'DATE_SUB(%s, INTERVAL WEEKDAY(%s) DAY)' % (day, day)
+
+
+@compiles(month_start)
+def _compile_month_start(element, compiler, **kw):
+    return "CAST(date_trunc('month', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, 'sqlite')
+def _compile_month_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'start of month')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, 'mysql')
+def _compile_month_start_mysql(element, compiler, **kw):
+    return "CAST(DATE_FORMAT(%s, '%%Y-%%m-01') AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+def bucket_of(day: date, granularity: str) -> date:
+    # Python counterpart of the SQL bucket expressions.
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(bucket: date, granularity: str) -> date:
+    if granularity == 'week':
+        return bucket + timedelta(weeks=1)
+    if granularity == 'month':
+        return date(bucket.year + bucket.month // 12, bucket.month % 12 + 1, 1)
+    return bucket + timedelta(days=1)
+
+
+def _as_date(value) -> date:
+    # SQLite returns computed dates as strings, other backends as dates.
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def timeseries_statement(user_id: int, start: date, end: date, granularity: str,
+                         habit_ids: Optional[Sequence[int]] = None):
+    # Builds the statement returning (habit_id, bucket, completed days, check-ins, completed periods)
+    # for every bucket with at least one completion, ordered by habit and bucket.
+    if granularity == 'week':
+        bucket = week_start(DailyCompletion.day)
+    elif granularity == 'month':
+        bucket = month_start(DailyCompletion.day)
+    else:
+        bucket = DailyCompletion.day
+
+    stmt = select(
+        DailyCompletion.habit_id,
+        bucket.label('bucket'),
+        func.count().label('completions'),
+        func.sum(DailyCompletion.count).label('check_ins'),
+        func.count(func.distinct(period_number(DailyCompletion.day))).label('periods')
+    ).join(Habit, Habit.id == DailyCompletion.habit_id).where(
+        Habit.user_id == user_id,
+        DailyCompletion.day >= start,
+        DailyCompletion.day <= end
+    )
+    if habit_ids:
+        stmt = stmt.where(DailyCompletion.habit_id.in_(habit_ids))
+    return stmt.group_by(DailyCompletion.habit_id, bucket).order_by(DailyCompletion.habit_id, bucket)
+
+
+def _bucket_entry(habit, bucket: date, start: date, end: date, granularity: str, completions: int, check_ins: int,
+                  periods: int):
+    # Builds the JSON entry of one bucket. The rate is the share of the habit's periods inside the
+    # bucket (clipped to the range and to the creation of the habit) that were completed.
+    first = max(bucket, start, habit['created'])
+    last = min(next_bucket(bucket, granularity) - timedelta(days=1), end)
+    days = (last - first).days + 1
+    expected = days / 7 if habit['periodicity'] == 'weekly' else days
+    rate = round(min(1.0, periods / expected), 4) if expected > 0 else None
+    return {'start': bucket.isoformat(), 'completions': completions, 'check_ins': check_ins, 'periods': periods,
+            'rate': rate}
+
+
+def _open_object(fields: dict, array_key: str) -> str:
+    # Returns the start of a JSON object with the given fields, left open inside an array under array_key.
+    members = ['{}: {}'.format(json.dumps(key), json.dumps(value)) for key, value in fields.items()]
+    return '{' + ', '.join(members + [json.dumps(array_key) + ': ['])
+
+
+def stream_timeseries(user_id: int, start: date, end: date, granularity: str,
+                      habit_ids: Optional[Sequence[int]] = None) -> Iterator[str]:
+    # Yields the JSON document of the time series in chunks. Every bucket of the range is emitted,
+    # buckets without completions with zero counts.
+    habit_query = select(Habit.id, Habit.name, Habit.periodicity, Habit.created_at).where(
+        Habit.user_id == user_id).order_by(Habit.id)
+    if habit_ids:
+        habit_query = habit_query.where(Habit.id.in_(habit_ids))
+    habits = [{
+        'id': habit_id, 'name': name, 'periodicity': periodicity,
+        'created': created_at.date() if created_at is not None else start
+    } for habit_id, name, periodicity, created_at in db.session.execute(habit_query)]
+
+    rows = db.session.execute(
+        timeseries_statement(user_id, start, end, granularity, habit_ids).execution_options(yield_per=1000)
+    )
+    row = next(rows, None)
+
+    yield _open_object({'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity}, 'habits')
+    for index, habit in enumerate(habits):
+        header = {key: habit[key] for key in ('id', 'name', 'periodicity')}
+        yield (', ' if index else '') + _open_object(header, 'buckets')
+
+        # Skip rows of habits that were filtered out, then merge the habit's rows into its buckets.
+        while row is not None and row[0] < habit['id']:
+            row = next(rows, None)
+        bucket = bucket_of(start, granularity)
+        separator = ''
+        while bucket <= end:
+            completions = check_ins = periods = 0
+            if row is not None and row[0] == habit['id'] and _as_date(row[1]) == bucket:
+                completions, check_ins, periods = int(row[2]), int(row[3]), int(row[4])
+                row = next(rows, None)
+            entry = _bucket_entry(habit, bucket, start, end, granularity, completions, check_ins, periods)
+            yield separator + json.dumps(entry)
+            separator = ', '
+            bucket = next_bucket(bucket, granularity)
+        yield ']}'
+    yield ']}'
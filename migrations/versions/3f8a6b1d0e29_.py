@@ -0,0 +1,107 @@
+"""backfill habit stats columns and completion bitmaps
+
+Revision ID: 3f8a6b1d0e29
+Revises: e5a0c3b8d417
+Create Date: 2026-10-19 09:31:05.118742
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a6b1d0e29'
+down_revision = 'e5a0c3b8d417'
+branch_labels = None
+depends_on = None
+
+habit = sa.table(
+    'habit',
+    sa.column('id', sa.Integer),
+    sa.column('periodicity', sa.String),
+    sa.column('created_at', sa.DateTime),
+    sa.column('completed', sa.Boolean),
+    sa.column('streak', sa.Integer),
+    sa.column('longest_streak', sa.Integer),
+    sa.column('last_completed', sa.Date),
+    sa.column('completion_bitmap', sa.LargeBinary),
+    sa.column('bitmap_origin', sa.Date),
+)
+completion = sa.table('completion', sa.column('habit_id', sa.Integer), sa.column('day', sa.Date))
+
+CHUNK_SIZE = 1000
+
+
+def period_of(periodicity, created, day):
+    # Same periods as Habit.period_of: day ordinals, or weeks starting on the weekday of creation.
+    if periodicity == 'weekly':
+        return (day.toordinal() - created.toordinal() % 7) // 7
+    return day.toordinal()
+
+
+def period_start(periodicity, created, period):
+    if periodicity == 'weekly':
+        return date.fromordinal(period * 7 + created.toordinal() % 7)
+    return date.fromordinal(period)
+
+
+def habit_stats(periodicity, created, days, today):
+    # Same values as Habit.rebuild_stats. Kept here, so the migration does not depend on the models.
+    periods = sorted({period_of(periodicity, created, day) for day in days})
+    value = 0
+    for period in periods:
+        value |= 1 << (period - periods[0])
+    streak = longest = 0
+    previous = None
+    for period in periods:
+        streak = streak + 1 if previous is not None and period == previous + 1 else 1
+        longest = max(longest, streak)
+        previous = period
+    last = max(days)
+    return {
+        'completion_bitmap': value.to_bytes((value.bit_length() + 7) // 8, 'little'),
+        'bitmap_origin': period_start(periodicity, created, periods[0]),
+        'streak': streak,
+        'longest_streak': longest,
+        'last_completed': last,
+        'completed': period_of(periodicity, created, last) == period_of(periodicity, created, today)
+    }
+
+
+def upgrade():
+    # Habits completed before their stats columns and bitmaps were maintained have none. The calendar reads
+    # daily habits from the bitmap, so they are computed here from the completions, in chunks of habits.
+    bind = op.get_bind()
+    today = date.today()
+    update = habit.update().where(habit.c.id == sa.bindparam('b_id')).values(
+        completion_bitmap=sa.bindparam('completion_bitmap'), bitmap_origin=sa.bindparam('bitmap_origin'),
+        streak=sa.bindparam('streak'), longest_streak=sa.bindparam('longest_streak'),
+        last_completed=sa.bindparam('last_completed'), completed=sa.bindparam('completed'))
+    last_id = 0
+    while True:
+        habits = bind.execute(
+            sa.select(habit.c.id, habit.c.periodicity, habit.c.created_at)
+            .where(habit.c.id > last_id, habit.c.completion_bitmap.is_(None),
+                   sa.exists().where(completion.c.habit_id == habit.c.id))
+            .order_by(habit.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not habits:
+            break
+        last_id = habits[-1].id
+
+        days = {row.id: [] for row in habits}
+        for habit_id, day in bind.execute(
+                sa.select(completion.c.habit_id, completion.c.day).where(completion.c.habit_id.in_(days))):
+            days[habit_id].append(day)
+        rows = []
+        for row in habits:
+            created = row.created_at.date() if row.created_at is not None else today
+            rows.append(dict(habit_stats(row.periodicity, created, days[row.id], today), b_id=row.id))
+        bind.execute(update, rows)
+
+
+def downgrade():
+    # The computed values stay; they match what the application maintains.
+    pass
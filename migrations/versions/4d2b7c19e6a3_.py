@@ -0,0 +1,29 @@
+"""backfill habit completed_count
+
+Revision ID: 4d2b7c19e6a3
+Revises: e91d5c08b7a2
+Create Date: 2026-10-18 15:41:07.226914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d2b7c19e6a3'
+down_revision = 'e91d5c08b7a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The counter was never written before, so it is filled from the completions once.
+    # From now on it is maintained by atomic increments on every completion insert and delete.
+    op.execute(
+        'UPDATE habit SET completed_count = '
+        '(SELECT COUNT(*) FROM completion WHERE completion.habit_id = habit.id)'
+    )
+
+
+def downgrade():
+    pass
@@ -4,7 +4,9 @@ from app import create_app, db
 from app.models import User, Habit, Completion
 from faker import Faker
 from app.routes.analytics import AnalyticsService
-from datetime import datetime, timedelta
+from app.streaks import longest_streaks, _longest_streaks_numpy, to_periods, longest_run, current_run, longest_runs
+import numpy as np
+from datetime import datetime, timedelta, date
 
 
 # Fixture to setup and tear down application context per function.
@@ -141,3 +143,250 @@ def test_longest_streak_for_a_given_habit(test_client, test_app, user_with_login
 
         longest_streak = AnalyticsService.calculate_longest_streak(habit_test.id)
         assert str(longest_streak) in response.data.decode('utf-8')
+
+
+# Test case for the set-based streak engine and its pure-Python fallback.
+def test_longest_streaks_all_habits(test_client, test_app, user_with_login, habits_created):
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        first, second, third = Habit.query.filter_by(user_id=user.id).order_by(Habit.id).all()
+
+        for i in range(4):
+            mark_habit_completed(first.id, datetime.now() - timedelta(days=i))
+        for i in (0, 1, 3, 4, 5):
+            mark_habit_completed(second.id, datetime.now() - timedelta(days=i))
+
+        expected = {first.id: 4, second.id: 3}
+        assert longest_streaks(user.id) == expected
+        assert _longest_streaks_numpy(user.id) == expected
+
+        habits, longest_streak = AnalyticsService.get_longest_streak_all_habits(user.id)
+        assert longest_streak == 4
+        assert [habit['id'] for habit in habits] == [first.id]
+        assert third.id not in longest_streaks(user.id)
+
+
+# Test case for the paginated habits by periodicity and longest streak pages.
+def test_analytics_pages_paginated(test_client, test_app, user_with_login, habits_created):
+    import re
+    from html import unescape
+    app, session = test_app
+    with app.app_context():
+        habits = Habit.query.filter_by(user_id=user_with_login.id).order_by(Habit.id).all()
+        create_habit('Weekly habit', 'Weekly', 'weekly', user_with_login.id, session)
+        for habit in habits:
+            mark_habit_completed(habit.id, datetime.now())
+
+        response = test_client.post(url_for('analytics.habits_by_periodicity'), data={'periodicity': 'daily'})
+        assert response.status_code == 302
+
+        for endpoint, args in (('analytics.habits_by_periodicity', {'periodicity': 'daily'}),
+                               ('analytics.longest_streak_all_habits', {})):
+            names, url = [], url_for(endpoint, page_size=2, **args)
+            while url:
+                page = test_client.get(url).get_data(as_text=True)
+                names += [name for name in (habit.name for habit in habits) if name in page]
+                links = re.findall(r'href="([^"]*cursor=[^"]*)">Next page', page)
+                url = unescape(links[0]) if links else None
+                assert 'Weekly habit' not in page
+            assert names == [habit.name for habit in habits]
+
+
+# Test case for the periodicity-aware streak calculation with duplicate completions.
+def test_calculate_longest_streak_periodicity(test_client, test_app, user_with_login):
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        create_habit("Weekly Habit", "Weekly Description", "weekly", user.id, session)
+        habit = Habit.query.filter_by(user_id=user.id).first()
+
+        # Two completions per week for three consecutive weeks form a streak of three weeks.
+        for week in range(3):
+            mark_habit_completed(habit.id, habit.created_at + timedelta(weeks=week))
+            mark_habit_completed(habit.id, habit.created_at + timedelta(weeks=week, days=1))
+
+        assert AnalyticsService.calculate_longest_streak(habit.id) == 3
+        assert longest_streaks(user.id) == {habit.id: 3}
+        assert _longest_streaks_numpy(user.id) == {habit.id: 3}
+
+
+# Test case for the NumPy run helpers and the batch API.
+def test_streak_runs():
+    periods = to_periods([10, 11, 11, 12, 20, 21, 30], 'daily')
+    assert periods.tolist() == [10, 11, 12, 20, 21, 30]
+    assert longest_run(periods) == 3
+    assert current_run(periods) == 1
+    assert to_periods([7, 8, 13, 14, 21], 'weekly', created_day=7).tolist() == [1, 2, 3]
+
+    arrays = [periods, np.array([], dtype=np.int64), np.arange(5, 3655), np.array([1, 2, 4, 5, 6])]
+    assert longest_runs(arrays).tolist() == [3, 0, 3650, 3]
+
+
+# Test case for the aggregated habit stats used by the analytics lists.
+def test_get_habit_stats(test_client, test_app, user_with_login, habits_created):
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        create_habit("Test Weekly Habit", "Test Weekly Description", "weekly", user.id, session)
+        first = Habit.query.filter_by(user_id=user.id).order_by(Habit.id).first()
+        first.created_at = datetime.now() - timedelta(days=9)
+        session.commit()
+        for i in (0, 1, 2, 4):
+            mark_habit_completed(first.id, datetime.now() - timedelta(days=i))
+
+        stats = AnalyticsService.get_habit_stats(user.id)
+        assert len(stats) == 4
+        assert stats[0]['name'] == first.name
+        assert stats[0]['completions_count'] == 4
+        assert stats[0]['longest_streak'] == 3
+        assert stats[0]['completion_rate'] == 0.4
+        assert all(row['completions_count'] == 0 and row['longest_streak'] == 0 and row['completion_rate'] == 0
+                   for row in stats[1:])
+
+        weekly = AnalyticsService.get_habit_stats(user.id, 'weekly')
+        assert [row['name'] for row in weekly] == ["Test Weekly Habit"]
+
+        response = test_client.get(url_for('analytics.all_habits'))
+        assert response.status_code == 200
+        assert first.name in response.data.decode('utf-8')
+        assert '<td>40%</td>' in response.data.decode('utf-8')
+
+
+# Test case for the analytics cache and its invalidation through the user's data version.
+def test_analytics_cache_invalidation(test_client, test_app, user_with_login, habits_created):
+    from app.cache import analytics_cache
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        habit = Habit.query.filter_by(user_id=user.id).first()
+        analytics_cache.clear()
+
+        assert AnalyticsService.get_longest_streaks(user.id) == {}
+        assert AnalyticsService.get_longest_streaks(user.id) == {}
+        assert analytics_cache.stats()['hits'] == 1
+
+        version = db.session.get(User, user.id).data_version
+        mark_habit_completed(habit.id, datetime.now())
+        assert db.session.get(User, user.id).data_version == version + 1
+        assert AnalyticsService.get_longest_streaks(user.id) == {habit.id: 1}
+        assert analytics_cache.stats()['misses'] == 2
+
+        # Keyword arguments are part of the key, and cached values cannot be modified by callers.
+        stats = AnalyticsService.get_habit_stats(user.id)
+        assert len(stats) == 3
+        assert AnalyticsService.get_habit_stats(user.id, periodicity='weekly') == ()
+        with pytest.raises(TypeError):
+            stats[0]['name'] = 'Changed'
+
+
+# Test case for the bucketed completion time series endpoint.
+def test_timeseries(test_client, test_app, user_with_login, habits_created):
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        habit = Habit.query.filter_by(user_id=user.id).order_by(Habit.id).first()
+        habit.created_at = datetime(2024, 1, 1)
+        session.commit()
+        for day in (1, 2, 3, 9, 31):
+            mark_habit_completed(habit.id, datetime(2024, 1, day, 8))
+        # Completing a day again increments the count of its completion.
+        from app.completions import complete_habit
+        complete_habit(habit, date(2024, 1, 1))
+        session.commit()
+
+        response = test_client.get(url_for('analytics.timeseries', start='2024-01-01', end='2024-01-31',
+                                           granularity='week', habit_id=habit.id))
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [entry['id'] for entry in data['habits']] == [habit.id]
+        buckets = data['habits'][0]['buckets']
+        assert [bucket['start'] for bucket in buckets] == ['2024-01-01', '2024-01-08', '2024-01-15',
+                                                            '2024-01-22', '2024-01-29']
+        assert [bucket['completions'] for bucket in buckets] == [3, 1, 0, 0, 1]
+        assert [bucket['check_ins'] for bucket in buckets] == [4, 1, 0, 0, 1]
+        assert buckets[0]['periods'] == 3
+        assert buckets[0]['rate'] == round(3 / 7, 4)
+        assert buckets[4]['rate'] == round(1 / 3, 4)
+
+        monthly = test_client.get(url_for('analytics.timeseries', start='2024-01-01', end='2024-03-31',
+                                          granularity='month')).get_json()
+        assert len(monthly['habits']) == 3
+        assert [bucket['start'] for bucket in monthly['habits'][0]['buckets']] == ['2024-01-01', '2024-02-01',
+                                                                                   '2024-03-01']
+
+        assert test_client.get(url_for('analytics.timeseries', granularity='year')).status_code == 400
+        assert test_client.get(url_for('analytics.timeseries', start='2000-01-01', end='2024-01-01',
+                                       granularity='month')).status_code == 400
+
+
+# Test case for the precompute command and the analytics reading its fresh results.
+def test_precompute_stats(test_client, test_app, user_with_login, habits_created):
+    from app.models import HabitStat
+    from app.cache import analytics_cache
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        habit = Habit.query.filter_by(user_id=user.id).order_by(Habit.id).first()
+        habit.created_at = datetime.now() - timedelta(days=9)
+        session.commit()
+        for i in (0, 1, 2, 5):
+            mark_habit_completed(habit.id, datetime.now() - timedelta(days=i))
+
+        result = app.test_cli_runner().invoke(args=['analytics', 'precompute', '--chunk-size', '1'])
+        assert 'Precomputed stats for 1 users.' in result.output
+        assert 'users/s' in result.output
+
+        stat = db.session.get(HabitStat, habit.id)
+        assert (stat.completions_count, stat.longest_streak, stat.current_streak) == (4, 3, 3)
+        assert stat.completion_rate == 0.4
+        assert HabitStat.query.filter_by(user_id=user.id).count() == 3
+
+        # Worker processes are fed the chunks as they are read.
+        result = app.test_cli_runner().invoke(args=['analytics', 'precompute', '--workers', '2', '--restart'])
+        assert 'Precomputed stats for 1 users.' in result.output
+        db.session.expire_all()
+        assert db.session.get(HabitStat, habit.id).longest_streak == 3
+
+        # Fresh rows are served as they are, stale rows are recomputed live.
+        stat.longest_streak = 42
+        session.commit()
+        analytics_cache.clear()
+        assert AnalyticsService.get_habit_stats(user.id)[0]['longest_streak'] == 42
+        assert AnalyticsService.get_habit_stats(user.id)[0]['completion_rate'] == 0.4
+        mark_habit_completed(habit.id, datetime.now() - timedelta(days=3))
+        assert AnalyticsService.get_habit_stats(user.id)[0]['longest_streak'] == 4
+
+
+# Test case for the year heatmap and its conditional GET handling.
+def test_heatmap(test_client, test_app, user_with_login, habits_created):
+    app, session = test_app
+    with app.app_context():
+        user = user_with_login
+        habit = Habit.query.filter_by(user_id=user.id).order_by(Habit.id).first()
+        mark_habit_completed(habit.id, datetime(2024, 1, 1, 9))
+        mark_habit_completed(habit.id, datetime(2024, 12, 31, 9))
+
+        response = test_client.get(url_for('analytics.heatmap_data', year=2024))
+        data = response.get_json()
+        assert data['days'] == 366
+        bits = data['habits'][0]['bits']
+        assert bits[0] == '1' and bits[-1] == '1' and bits.count('1') == 2
+        assert all(entry['bits'] == '0' * 366 for entry in data['habits'][1:])
+
+        etag = response.headers['ETag']
+        assert test_client.get(url_for('analytics.heatmap_data', year=2024),
+                               headers={'If-None-Match': etag}).status_code == 304
+
+        mark_habit_completed(habit.id, datetime(2024, 6, 1, 9))
+        assert test_client.get(url_for('analytics.heatmap_data', year=2024),
+                               headers={'If-None-Match': etag}).status_code == 200
+
+        assert test_client.get(url_for('analytics.heatmap', year=2024)).status_code == 200
+
+        # Years outside the range of dates are refused, the first and the last one are shown.
+        for year in (0, 10000):
+            assert test_client.get(url_for('analytics.heatmap', year=year)).status_code == 400
+            assert test_client.get(url_for('analytics.heatmap_data', year=year)).status_code == 400
+        for year in (1, 9999):
+            assert test_client.get(url_for('analytics.heatmap', year=year)).status_code == 200
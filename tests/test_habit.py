@@ -98,6 +98,48 @@ def test_edit_habit(test_client, test_app, habit_created):
     print(page_content)
 
 
+# Test case for changing the periodicity of a habit with completions.
+def test_edit_habit_periodicity(test_client, test_app, habit_created):
+    from datetime import date, datetime
+    from app.routes.calendar import completed_days
+    habit_id = habit_created.id
+    habit = db.session.get(Habit, habit_id)
+    habit.periodicity = 'weekly'
+    habit.created_at = datetime(2026, 8, 26)
+    db.session.commit()
+    days = [date(2026, 9, 2), date(2026, 9, 9), date(2026, 10, 18)]
+    for day in days:
+        db.session.add(Completion(completed_at=day, habit_id=habit_id))
+    db.session.commit()
+
+    response = test_client.post(url_for('habit.edit_habit', habit_id=habit_id), data={
+        'name': 'Read a Book', 'description': 'Read one chapter of a book', 'periodicity': 'daily'})
+    assert response.status_code == 200
+
+    habit = db.session.get(Habit, habit_id)
+    assert habit.periodicity == 'daily'
+    assert habit.bitmap_origin == date(2026, 9, 2)
+    assert habit.longest_streak == 1
+    assert habit.last_completed == date(2026, 10, 18)
+    assert completed_days(habit_id, date(2026, 9, 1), date(2026, 10, 31)) == set(days)
+
+
+# Test case for the calendar of a habit whose bitmap was never built, e.g. one completed before migrating.
+def test_completed_days_without_bitmap(test_client, test_app, habit_created):
+    from datetime import date
+    from sqlalchemy import update
+    from app.routes.calendar import completed_days
+    habit_id = habit_created.id
+    days = [date(2026, 10, 1), date(2026, 10, 2)]
+    for day in days:
+        db.session.add(Completion(completed_at=day, habit_id=habit_id))
+    db.session.commit()
+    db.session.execute(update(Habit).where(Habit.id == habit_id).values(completion_bitmap=None, bitmap_origin=None))
+    db.session.commit()
+
+    assert completed_days(habit_id, date(2026, 9, 1), date(2026, 10, 31)) == set(days)
+
+
 # Test case for deleting a habit.
 def test_delete_habit(test_client, test_app, habit_created):
     habit_id = habit_created.id
@@ -106,6 +148,55 @@ def test_delete_habit(test_client, test_app, habit_created):
     assert 'Habit deleted!' in response.get_data(as_text=True)
 
 
+# Test case for deleting habits with their history, one by one, in a batch and in chunks.
+def test_delete_habit_with_history(test_client, test_app, habit_with_completions):
+    from datetime import date
+    from app.models import Reminder, DailyCompletion, Tombstone
+    from app.deletion import delete_habits
+    user_id, habit_id = habit_with_completions.user_id, habit_with_completions.id
+    version = db.session.get(User, user_id).data_version
+    db.session.add(Reminder(message='Read', date=date.today(), habit_id=habit_id))
+    others = [Habit(name='Habit {}'.format(number), periodicity='daily', user_id=user_id) for number in range(2)]
+    db.session.add_all(others)
+    db.session.commit()
+    for habit in others:
+        db.session.add(Completion(completed_at=date.today(), habit_id=habit.id))
+    db.session.commit()
+
+    test_client.post(url_for('habit.delete_habit', habit_id=habit_id))
+    assert db.session.get(Habit, habit_id) is None
+    assert Completion.query.filter_by(habit_id=habit_id).count() == 0
+    assert Reminder.query.filter_by(habit_id=habit_id).count() == 0
+    assert DailyCompletion.query.filter_by(habit_id=habit_id).count() == 0
+    assert db.session.get(User, user_id).data_version > version
+
+    other_ids = [habit.id for habit in others]
+    response = test_client.post(url_for('habit.delete_selected_habits'),
+                                data={'habit_id': other_ids}, follow_redirects=True)
+    assert '2 habits deleted!' in response.get_data(as_text=True)
+    assert Habit.query.filter_by(user_id=user_id).count() == 0
+    assert Completion.query.count() == 0
+
+    # Histories longer than the chunk size are deleted in several statements of one transaction.
+    habit = Habit(name='Long history', periodicity='daily', user_id=user_id)
+    db.session.add(habit)
+    db.session.commit()
+    for day in range(1, 11):
+        db.session.add(Completion(completed_at=date(2024, 1, day), habit_id=habit.id))
+    db.session.commit()
+    habit_id = habit.id
+    assert delete_habits(user_id, [habit_id], chunk_size=3) == [habit_id]
+    db.session.rollback()
+    assert db.session.get(Habit, habit_id) is not None
+    assert Completion.query.filter_by(habit_id=habit_id).count() == 10
+
+    assert delete_habits(user_id, [habit_id, habit_id + 1000], chunk_size=3) == [habit_id]
+    db.session.commit()
+    assert Completion.query.count() == 0
+    assert DailyCompletion.query.count() == 0
+    assert Tombstone.query.filter_by(user_id=user_id, entity='habit').count() == 4
+
+
 # Test case for marking a habit as completed.
 def test_mark_completed(test_client, test_app, habit_created):
     habit_id = habit_created.id
@@ -117,11 +208,53 @@ def test_mark_completed(test_client, test_app, habit_created):
         assert completion_count == 1
 
 
+# Test case for completing a habit twice on the same day.
+def test_mark_completed_twice(test_client, test_app, habit_created):
+    from datetime import date
+    from app.models import DailyCompletion
+    habit_id = habit_created.id
+    for _ in range(2):
+        response = test_client.post(url_for('habit.mark_completed', habit_id=habit_id), follow_redirects=True)
+        assert 'Habit marked as completed!' in response.get_data(as_text=True)
+
+    completions = Completion.query.filter_by(habit_id=habit_id).all()
+    assert len(completions) == 1
+    assert completions[0].day == date.today()
+    assert completions[0].count == 2
+    habit = db.session.get(Habit, habit_id)
+    assert habit.completed_count == 1
+    assert habit.streak == 1
+    assert db.session.get(DailyCompletion, (habit_id, date.today())).count == 2
+
+
+# Test case for a streak broken by a missed period.
+def test_broken_streak(test_client, test_app, habit_created):
+    import re
+    from datetime import date, timedelta
+    habit_id = habit_created.id
+    today = date.today()
+    for days in range(3, 10):
+        db.session.add(Completion(completed_at=today - timedelta(days=days), habit_id=habit_id))
+    db.session.commit()
+
+    habit = db.session.get(Habit, habit_id)
+    assert habit.streak == 7
+    assert habit.current_streak == 0
+    page = test_client.get(url_for('habit.index')).get_data(as_text=True)
+    assert re.search(r'<td>7</td> <!-- Displaying the count here -->\s*<td>0</td>', page)
+
+    db.session.add(Completion(completed_at=today - timedelta(days=1), habit_id=habit_id))
+    db.session.commit()
+    assert db.session.get(Habit, habit_id).current_streak == 1
+
+
 # This fixture will add 28 completions to a habit
 @pytest.fixture(scope='function')
 def habit_with_completions(test_app, habit_created):
-    from datetime import timedelta, date
+    from datetime import timedelta, date, datetime
 
+    # the habit was created long before its history, so completions of any recent day are accepted
+    db.session.get(Habit, habit_created.id).created_at = datetime.now() - timedelta(days=4000)
     # with each iteration, a date in the past 28 days is set as completion date for a habit
     for i in range(1, 29):
         completion_date = date.today() - timedelta(days=i)
@@ -140,3 +273,401 @@ def test_habit_completions(test_client, test_app, habit_with_completions):
         completion_count = Completion.query.filter_by(habit_id=habit_id).count()
         assert completion_count == 28  # assert that 28 completions have been created
 
+
+# Test case for the stats columns maintained on every completion.
+def test_mark_completed_updates_stats(test_client, test_app, habit_with_completions):
+    from datetime import date
+    habit_id = habit_with_completions.id
+    test_client.post(url_for('habit.mark_completed', habit_id=habit_id), follow_redirects=True)
+    with test_app.app_context():
+        habit = db.session.get(Habit, habit_id)
+        assert habit.last_completed == date.today()
+        assert habit.streak == 29
+        assert habit.longest_streak == 29
+        assert habit.completed_count == 29
+
+
+# Test case for the completion counter maintained in SQL and the single-query habit list.
+def test_completed_count_counter(test_client, test_app, habit_with_completions):
+    from sqlalchemy import event
+    habit = db.session.get(Habit, habit_with_completions.id)
+    assert habit.completed_count == 28
+
+    # The counter is reloaded after the flush that changed it in SQL.
+    completion = Completion.query.filter_by(habit_id=habit.id).first()
+    db.session.delete(completion)
+    db.session.flush()
+    assert habit.completed_count == 27
+    db.session.commit()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = test_client.get(url_for('habit.index'))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200
+    assert not [statement for statement in statements if 'FROM completion' in statement]
+    assert len([statement for statement in statements if 'FROM habit' in statement]) == 1
+
+
+# Test case for the bulk completion endpoint.
+def test_bulk_completions(test_client, test_app, habit_with_completions):
+    from datetime import date, timedelta
+    from app.models import DailyCompletion
+    habit_id = habit_with_completions.id
+    today = date.today()
+    version = db.session.get(Habit, habit_id).user.data_version
+    items = [
+        {'habit_id': habit_id, 'date': today.isoformat()},
+        {'habit_id': habit_id, 'date': (today - timedelta(days=1)).isoformat()},
+        {'habit_id': habit_id, 'date': (today - timedelta(days=40)).isoformat()},
+        {'habit_id': habit_id, 'date': today.isoformat()},
+        {'habit_id': habit_id, 'date': (today + timedelta(days=1)).isoformat()},
+        {'habit_id': 'x', 'date': today.isoformat()},
+        {'habit_id': habit_id + 1000, 'date': today.isoformat()}
+    ]
+    response = test_client.post(url_for('habit.bulk_completions'), json={'completions': items})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [result['status'] for result in data['results']] == [
+        'created', 'exists', 'created', 'exists', 'invalid', 'invalid', 'not_found']
+    assert data['summary'] == {'created': 2, 'exists': 2, 'invalid': 2, 'not_found': 1}
+
+    habit = db.session.get(Habit, habit_id)
+    assert habit.completed_count == 30
+    assert habit.streak == 29
+    assert habit.user.data_version > version
+    assert DailyCompletion.query.filter_by(habit_id=habit_id).count() == 30
+
+    # Repeating the request changes nothing.
+    response = test_client.post(url_for('habit.bulk_completions'), json={'completions': items[:3]})
+    assert [result['status'] for result in response.get_json()['results']] == ['exists'] * 3
+    assert Completion.query.filter_by(habit_id=habit_id).count() == 30
+
+    # Thousands of completions are written in one request.
+    items = [{'habit_id': habit_id, 'date': (today - timedelta(days=i)).isoformat()} for i in range(3000)]
+    response = test_client.post(url_for('habit.bulk_completions'), json={'completions': items})
+    assert response.get_json()['summary'] == {'created': 2970, 'exists': 30}
+    habit = db.session.get(Habit, habit_id)
+    assert habit.completed_count == 3000
+    assert habit.longest_streak == 3000
+
+    assert test_client.post(url_for('habit.bulk_completions'), json={}).status_code == 400
+
+    # Habit ids must be integers, and completions cannot lie before the creation of the habit.
+    items = [{'habit_id': True, 'date': today.isoformat()}, {'habit_id': float(habit_id), 'date': today.isoformat()},
+             {'habit_id': habit_id, 'date': '0001-01-01'}]
+    response = test_client.post(url_for('habit.bulk_completions'), json={'completions': items})
+    assert [result['status'] for result in response.get_json()['results']] == ['invalid'] * 3
+    assert db.session.get(Habit, habit_id).bitmap_origin == today - timedelta(days=2999)
+
+
+# Test case for the offline sync endpoint.
+def test_sync_completions(test_client, test_app, habit_with_completions):
+    import json
+    from datetime import date, datetime, timedelta
+    from app.models import DailyCompletion
+    habit_id = habit_with_completions.id
+    today = datetime.combine(date.today(), datetime.min.time()).replace(hour=7)
+    lines = [
+        {'key': 'a', 'habit_id': habit_id, 'completed_at': today.isoformat()},
+        {'key': 'b', 'habit_id': habit_id, 'completed_at': (today + timedelta(hours=12)).isoformat()},
+        {'key': 'c', 'habit_id': habit_id, 'completed_at': (today - timedelta(days=1)).isoformat() + '+02:00'},
+        {'key': 'a', 'habit_id': habit_id, 'completed_at': today.isoformat()},
+        {'key': 'd', 'habit_id': habit_id, 'completed_at': (today + timedelta(days=5)).isoformat()},
+        {'key': 'e', 'habit_id': habit_id + 1000, 'completed_at': today.isoformat()},
+        {'habit_id': habit_id, 'completed_at': today.isoformat()}
+    ]
+    body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+    response = test_client.post(url_for('habit.sync_completions'), data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [result['status'] for result in results] == [
+        'created', 'counted', 'counted', 'duplicate', 'invalid', 'not_found', 'invalid', 'invalid']
+    assert [result['i'] for result in results] == list(range(8))
+    assert results[0]['key'] == 'a'
+
+    habit = db.session.get(Habit, habit_id)
+    assert habit.completed_count == 29
+    assert Completion.query.filter_by(habit_id=habit_id, day=today.date()).one().count == 2
+    assert DailyCompletion.query.filter_by(habit_id=habit_id, day=today.date()).one().count == 2
+
+    # Resending the batch after a lost response applies nothing twice.
+    response = test_client.post(url_for('habit.sync_completions'), data=body)
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [result['status'] for result in results[:4]] == ['duplicate'] * 4
+    assert Completion.query.filter_by(habit_id=habit_id, day=today.date()).one().count == 2
+    assert db.session.get(Habit, habit_id).completed_count == 29
+
+    # Habit ids must be integers, and completions cannot lie before the creation of the habit.
+    lines = [{'key': 'f', 'habit_id': habit_id, 'completed_at': '0001-01-01T08:00:00'},
+             {'key': 'g', 'habit_id': True, 'completed_at': today.isoformat()}]
+    response = test_client.post(url_for('habit.sync_completions'), data='\n'.join(json.dumps(line) for line in lines))
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [result['status'] for result in results] == ['invalid', 'invalid']
+    assert db.session.get(Habit, habit_id).completed_count == 29
+
+
+# Test case for the change feed.
+def test_change_feed(test_client, test_app, habit_with_completions):
+    from datetime import date
+    from app.models import Reminder
+    habit_id = habit_with_completions.id
+    habit_created_later = Habit(name='Stretch', periodicity='daily', user_id=habit_with_completions.user_id)
+    db.session.add(habit_created_later)
+    db.session.commit()
+    later_id = habit_created_later.id
+
+    # The first refresh returns everything.
+    data = test_client.get(url_for('habit.changes')).get_json()
+    assert {habit['id'] for habit in data['habits']} == {habit_id, later_id}
+    assert len(data['completions']) == 28
+    assert data['deleted'] == []
+    cursor = data['cursor']
+    data = test_client.get(url_for('habit.changes', cursor=cursor)).get_json()
+    assert data == {'cursor': cursor, 'habits': [], 'completions': [], 'reminders': [], 'deleted': []}
+
+    # Later refreshes return only what changed, including the deletions.
+    test_client.post(url_for('habit.mark_completed', habit_id=habit_id))
+    test_client.post(url_for('habit.mark_completed', habit_id=habit_id))
+    reminder = Reminder(message='Read tonight', date=date.today(), habit_id=habit_id)
+    db.session.add(reminder)
+    db.session.commit()
+    data = test_client.get(url_for('habit.changes', cursor=cursor)).get_json()
+    assert [habit['id'] for habit in data['habits']] == [habit_id]
+    assert data['habits'][0]['completed_count'] == 29
+    assert [(completion['day'], completion['count']) for completion in data['completions']] == [
+        (date.today().isoformat(), 2)]
+    assert [item['message'] for item in data['reminders']] == ['Read tonight']
+    assert data['cursor'] > cursor
+    cursor = data['cursor']
+
+    reminder_id = reminder.id
+    db.session.delete(reminder)
+    db.session.commit()
+    test_client.post(url_for('habit.delete_habit', habit_id=later_id))
+    data = test_client.get(url_for('habit.changes', cursor=cursor)).get_json()
+    assert data['habits'] == [] and data['completions'] == [] and data['reminders'] == []
+    assert data['deleted'] == [{'type': 'reminder', 'id': reminder_id}, {'type': 'habit', 'id': later_id}]
+
+    assert test_client.get(url_for('habit.changes', cursor=data['cursor'] + 1)).status_code == 400
+    assert test_client.get(url_for('habit.changes', cursor='x')).status_code == 400
+
+
+# Test case for the keyset pagination of the habit list and the completion history.
+def test_habit_list_pagination(test_client, test_app, habit_with_completions):
+    import re
+    from html import unescape
+    from app.pagination import encode_cursor
+    user_id = habit_with_completions.user_id
+    for number in range(4):
+        db.session.add(Habit(name='Habit {}'.format(number), periodicity='daily', user_id=user_id))
+    db.session.commit()
+
+    # Following the next page links visits every habit once, in the order of creation.
+    names, url = [], url_for('habit.index', page_size=2)
+    while url:
+        page = test_client.get(url).get_data(as_text=True)
+        names += re.findall(r'<td>(Read a Book|Habit \d)</td>', page)
+        links = re.findall(r'href="([^"]*cursor=[^"]*)">Next page', page)
+        url = unescape(links[0]) if links else None
+    assert names == ['Read a Book', 'Habit 0', 'Habit 1', 'Habit 2', 'Habit 3']
+
+    page = test_client.get(url_for('habit.completion_history', habit_id=habit_with_completions.id, page_size=20))
+    assert page.status_code == 200
+    days = re.findall(r'<td>(\d{4}-\d{2}-\d{2})</td>', page.get_data(as_text=True))
+    assert len(days) == 20
+    assert days == sorted(days, reverse=True)
+
+    assert test_client.get(url_for('habit.index', cursor='not-a-cursor')).status_code == 400
+    assert test_client.get(url_for('habit.index', cursor=encode_cursor([1, 1]))).status_code == 400
+
+
+# Test case for the completed flag and its rollover at period boundaries.
+def test_rollover_completed(test_client, test_app, habit_created):
+    from datetime import date, datetime
+    from app.rollover import rollover_completed
+    habit_id = habit_created.id
+    test_client.post(url_for('habit.mark_completed', habit_id=habit_id))
+    assert db.session.get(Habit, habit_id).completed is True
+
+    # Weekly habits created on a Wednesday, completed in the current and in the previous week.
+    user_id = habit_created.user_id
+    current = Habit(name='Current', periodicity='weekly', user_id=user_id, created_at=datetime(2024, 1, 3))
+    previous = Habit(name='Previous', periodicity='weekly', user_id=user_id, created_at=datetime(2024, 1, 3))
+    db.session.add_all([current, previous])
+    db.session.commit()
+    db.session.add(Completion(completed_at=datetime(2024, 1, 17), habit_id=current.id))
+    db.session.add(Completion(completed_at=datetime(2024, 1, 16), habit_id=previous.id))
+    db.session.commit()
+    current.completed = previous.completed = True
+    db.session.commit()
+    current_id, previous_id = current.id, previous.id
+    version = db.session.get(User, user_id).data_version
+
+    # On Tuesday 2024-01-23 the daily habit and the week from 01-10 to 01-16 are over.
+    assert rollover_completed(today=date(2024, 1, 23), report=lambda message: None) == {'daily': 0, 'weekly': 1}
+    db.session.commit()
+    assert db.session.get(Habit, previous_id).completed is False
+    assert db.session.get(Habit, current_id).completed is True
+    # The reset habit is stamped with the bumped data version, so the change feed serves it.
+    assert db.session.get(User, user_id).data_version == version + 1
+    assert db.session.get(Habit, previous_id).change_seq == version + 1
+
+    result = test_app.test_cli_runner().invoke(args=['habits', 'rollover'])
+    assert 'Reset 0 daily habits' in result.output
+    assert 'Reset 1 weekly habits' in result.output
+    assert db.session.get(Habit, habit_id).completed is True
+    assert db.session.get(Habit, current_id).completed is False
+
+
+# Test case for rebuilding the stats columns from the raw completions.
+def test_repair_stats_command(test_app, habit_with_completions):
+    habit = db.session.get(Habit, habit_with_completions.id)
+    habit.streak, habit.longest_streak, habit.completed_count, habit.last_completed = 0, 0, 0, None
+    db.session.commit()
+
+    result = test_app.test_cli_runner().invoke(args=['habits', 'repair-stats'])
+    assert 'Rebuilt stats for 1 habits.' in result.output
+
+    habit = db.session.get(Habit, habit_with_completions.id)
+    assert habit.streak == 28
+    assert habit.longest_streak == 28
+    assert habit.completed_count == 28
+
+
+# Test case for the daily rollup maintained on completion insert and delete.
+def test_daily_rollup(test_client, test_app, habit_with_completions):
+    from datetime import date
+    from app.models import DailyCompletion
+    habit_id = habit_with_completions.id
+    test_client.post(url_for('habit.mark_completed', habit_id=habit_id), follow_redirects=True)
+    test_client.post(url_for('habit.mark_completed', habit_id=habit_id), follow_redirects=True)
+    with test_app.app_context():
+        assert DailyCompletion.query.filter_by(habit_id=habit_id).count() == 29
+        assert db.session.get(DailyCompletion, (habit_id, date.today())).count == 2
+
+        for completion in Completion.query.filter_by(habit_id=habit_id).all():
+            if completion.completed_at.date() == date.today():
+                db.session.delete(completion)
+        db.session.commit()
+        assert db.session.get(DailyCompletion, (habit_id, date.today())) is None
+        assert DailyCompletion.query.filter_by(habit_id=habit_id).count() == 28
+
+
+# Test case for the completion bitmap kept in sync with the completions.
+def test_completion_bitmap(test_client, test_app, habit_with_completions):
+    from datetime import date, timedelta
+    habit_id = habit_with_completions.id
+    with test_app.app_context():
+        habit = db.session.get(Habit, habit_id)
+        assert habit.completed_periods_count == 28
+        assert habit.bitmap_longest_streak == 28
+        today = date.today()
+        assert habit.completed_periods(today - timedelta(days=29), today) == [False] + [True] * 28 + [False]
+
+        # A completion far before the bitmap origin moves the origin back.
+        db.session.add(Completion(completed_at=today - timedelta(days=100), habit_id=habit_id))
+        db.session.commit()
+        habit = db.session.get(Habit, habit_id)
+        assert habit.bitmap_origin == today - timedelta(days=100)
+        assert habit.completed_periods_count == 29
+        assert habit.bitmap_longest_streak == 28
+
+        # The calendar page shows the totals and the streak read from the bitmap.
+        page = test_client.get(url_for('habit.habit_calendar', habit_id=habit_id)).get_data(as_text=True)
+        assert 'Completed days: 29' in page and 'longest streak: 28' in page
+
+        for completion in Completion.query.filter_by(habit_id=habit_id).all():
+            if completion.completed_at.date() == today - timedelta(days=1):
+                db.session.delete(completion)
+        db.session.commit()
+        habit = db.session.get(Habit, habit_id)
+        assert habit.completed_periods_count == 28
+        assert habit.bitmap_longest_streak == 27
+
+
+# Test case for the calendar page and the multi-month calendar data.
+def test_habit_calendar(test_client, test_app, habit_with_completions):
+    from datetime import date, timedelta
+    habit_id = habit_with_completions.id
+    response = test_client.get(url_for('habit.habit_calendar', habit_id=habit_id))
+    assert response.status_code == 200
+
+    yesterday = date.today() - timedelta(days=1)
+    response = test_client.get(url_for('habit.calendar_months', habit_id=habit_id,
+                                       year=yesterday.year, month=yesterday.month, count=2))
+    months = response.get_json()['months']
+    assert [(entry['year'], entry['month']) for entry in months][0] == (yesterday.year, yesterday.month)
+    assert len(months) == 2
+    assert months[0]['days'][yesterday.day - 1]['completed'] is True
+    assert months[0]['days'][0]['weekday'] == date(yesterday.year, yesterday.month, 1).weekday()
+
+    # Months beyond the range of dates are refused, the last one is served.
+    for year, month, count in ((9999, 12, 3), (9999, 11, 3), (0, 1, 1)):
+        assert test_client.get(url_for('habit.calendar_months', habit_id=habit_id, year=year, month=month,
+                                       count=count)).status_code == 400
+    response = test_client.get(url_for('habit.calendar_months', habit_id=habit_id, year=9999, month=11, count=2))
+    assert [len(entry['days']) for entry in response.get_json()['months']] == [30, 31]
+
+
+# Test case for the day classification of the calendar.
+def test_day_statuses(test_app, habit_created):
+    from datetime import date, datetime
+    from app.routes.calendar import day_statuses
+    habit = db.session.get(Habit, habit_created.id)
+    habit.created_at = datetime(2024, 1, 3, 12)
+    for day in (4, 5, 10):
+        db.session.add(Completion(completed_at=datetime(2024, 1, day, 9), habit_id=habit.id))
+    db.session.commit()
+
+    statuses = [status for _, _, status in day_statuses(habit, 2024, 1, today=date(2024, 1, 12))]
+    assert statuses[:12] == [None, None, 'broken', 'completed', 'completed', 'broken', 'broken', 'broken',
+                             'broken', 'completed', 'broken', None]
+    assert set(statuses[12:]) == {'future'}
+
+    daily_statuses = statuses
+
+    # Weekly periods start on the weekday of creation (Wednesday, 2024-01-03).
+    # Changing the periodicity rebuilds the stats and the bitmap in the new periods.
+    habit.periodicity = 'weekly'
+    db.session.commit()
+    assert habit.bitmap_origin == date(2024, 1, 3)
+    assert habit.completed_periods_count == 2
+    assert habit.longest_streak == 2
+    statuses = [status for _, _, status in day_statuses(habit, 2024, 1, today=date(2024, 1, 25))]
+    assert statuses[2:16] == ['completed'] * 14
+    assert statuses[16:22] == [None] * 6
+    assert statuses[22] == 'broken'
+    assert statuses[23:25] == [None, None]
+    assert set(statuses[25:]) == {'future'}
+
+    habit.periodicity = 'daily'
+    db.session.commit()
+    assert habit.completed_periods_count == 3
+    assert habit.longest_streak == 2
+    assert [status for _, _, status in day_statuses(habit, 2024, 1, today=date(2024, 1, 12))] == daily_statuses
+
+
+# Test case for the conditional responses of the habit pages.
+def test_habit_pages_not_modified(test_client, test_app, habit_created):
+    for url in ('/habits/', '/habits/{}/calendar'.format(habit_created.id)):
+        response = test_client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert test_client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Pending flash messages are always rendered.
+    etag = test_client.get('/habits/').headers['ETag']
+    test_client.post('/habits/complete/{}'.format(habit_created.id))
+    response = test_client.get('/habits/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Habit marked as completed!' in response.data
+
+    # Completing the habit changed the user's data version, so the page renders again.
+    response = test_client.get('/habits/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
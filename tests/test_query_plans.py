@@ -0,0 +1,154 @@
+import re
+import pytest
+from datetime import date, datetime, timedelta
+from flask import url_for
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Habit, Completion, Reminder
+from app.pagination import encode_cursor
+
+
+# Query plan regression checks.
+# Every route below is requested while the executed statements are recorded, then each statement is run
+# through EXPLAIN QUERY PLAN. A plan scanning a whole table instead of searching an index fails the test.
+
+
+# Fixture to setup and tear down application context per function.
+@pytest.fixture(scope='function')
+def test_app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+# Fixture to return an instance of test client per function.
+@pytest.fixture(scope='function')
+def test_client(test_app):
+    return test_app.test_client()
+
+
+# Fixture to create a user with a daily and a weekly habit, completions and a reminder,
+# and to log the user in with the test client.
+@pytest.fixture(scope='function')
+def user_with_data(test_client):
+    user = User(username='planner', email='planner@example.com')
+    user.set_password('testpassword123')
+    db.session.add(user)
+    db.session.commit()
+
+    daily = Habit(name='Read', description='Read a chapter', periodicity='daily', user_id=user.id)
+    weekly = Habit(name='Hike', description='Go hiking', periodicity='weekly', user_id=user.id)
+    db.session.add_all([daily, weekly])
+    db.session.commit()
+    for i in range(1, 15):
+        db.session.add(Completion(completed_at=date.today() - timedelta(days=i), habit_id=daily.id))
+    db.session.add(Reminder(message='Read tonight', date=date.today(), next_due=date.today(), habit_id=daily.id))
+    db.session.commit()
+
+    result = test_client.post('/auth/login', data={'email': 'planner@example.com', 'password': 'testpassword123'})
+    assert result.status_code == 302
+    return daily, weekly
+
+
+# Records the statements executed while the given requests run.
+def record_statements(requests):
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and re.match(r'\s*(SELECT|WITH|UPDATE|DELETE)\b', statement, re.IGNORECASE):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        for request in requests:
+            response = request()
+            assert response.status_code in (200, 302), response.request.path
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return statements
+
+
+# Returns the plan steps of a statement scanning a whole table.
+def full_scans(statement, parameters):
+    tables = set(db.metadata.tables)
+    plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    scans = []
+    for row in plan:
+        match = re.match(r'SCAN (\w+?)(_\d+)?\b', row[3])
+        if match and match.group(1) in tables:
+            scans.append(row[3])
+    return scans
+
+
+# Test case checking the query plans of the habit, reminder and analytics routes.
+def test_routes_use_indexes(test_client, test_app, user_with_data):
+    daily, weekly = user_with_data
+    requests = [
+        lambda: test_client.get(url_for('main.index')),
+        lambda: test_client.get(url_for('habit.index')),
+        lambda: test_client.get(url_for('habit.habit_calendar', habit_id=daily.id)),
+        lambda: test_client.get(url_for('habit.habit_calendar', habit_id=weekly.id)),
+        lambda: test_client.get(url_for('habit.calendar_months', habit_id=weekly.id)),
+        lambda: test_client.post(url_for('habit.mark_completed', habit_id=daily.id)),
+        lambda: test_client.post(url_for('habit.bulk_completions'), json={'completions': [
+            {'habit_id': weekly.id, 'date': (date.today() - timedelta(days=3)).isoformat()}]}),
+        lambda: test_client.post(url_for('habit.sync_completions'), data='{{"key": "k", "habit_id": {}, '
+                                 '"completed_at": "{}T08:00:00"}}'.format(daily.id, date.today().isoformat())),
+        lambda: test_client.get(url_for('habit.changes')),
+        lambda: test_client.get(url_for('habit.changes', cursor=1)),
+        lambda: test_client.get(url_for('habit.index', page_size=1)),
+        lambda: test_client.get(url_for('habit.index', cursor=encode_cursor([datetime(2000, 1, 1), 0]))),
+        lambda: test_client.get(url_for('habit.completion_history', habit_id=daily.id, page_size=5)),
+        lambda: test_client.get(url_for('habit.completion_history', habit_id=daily.id,
+                                        cursor=encode_cursor([date.today(), 0]))),
+        lambda: test_client.get(url_for('reminder.index')),
+        lambda: test_client.get(url_for('reminder.index', cursor=encode_cursor([date(2000, 1, 1), 0]))),
+        lambda: test_client.get(url_for('analytics.all_habits')),
+        lambda: test_client.get(url_for('analytics.all_habits', cursor=encode_cursor([datetime(2000, 1, 1), 0]))),
+        lambda: test_client.get(url_for('analytics.habits_by_periodicity', periodicity='daily')),
+        lambda: test_client.get(url_for('analytics.habits_by_periodicity', periodicity='daily',
+                                        cursor=encode_cursor([datetime(2000, 1, 1), 0]))),
+        lambda: test_client.get(url_for('analytics.longest_streak_all_habits')),
+        lambda: test_client.get(url_for('analytics.longest_streak_for_a_given_habit', habit_id=daily.id)),
+        lambda: test_client.get(url_for('analytics.heatmap')),
+        lambda: test_client.get(url_for('analytics.timeseries', granularity='week')),
+        lambda: test_client.post(url_for('habit.delete_habit', habit_id=weekly.id)),
+        lambda: test_client.post(url_for('habit.delete_selected_habits'), data={'habit_id': [daily.id]}),
+    ]
+    statements = record_statements(requests)
+    assert statements
+
+    failures = {}
+    for statement, parameters in statements:
+        scans = full_scans(statement, parameters)
+        if scans:
+            failures[' '.join(statement.split())] = scans
+    assert not failures
+
+
+# Test case checking the query plans of a reminder dispatcher tick.
+def test_dispatcher_uses_indexes(test_app, user_with_data):
+    import asyncio
+    from app.dispatcher import Dispatcher, Sink
+
+    class NullSink(Sink):
+        def send(self, reminder):
+            pass
+
+    dispatcher = Dispatcher(NullSink(), report=lambda message: None)
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert asyncio.run(dispatcher.tick()) == 1
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert statements
+    for statement, parameters in statements:
+        assert not full_scans(statement, parameters), statement
@@ -87,6 +87,209 @@ def test_reminders_index(test_client, user_with_login, reminder_created):
     assert b'TestReminder' in response.data
 
 
+# Test case for the keyset pagination of the reminders index.
+def test_reminders_index_pagination(test_client, user_with_login, habit_created):
+    import re
+    from datetime import date
+    from html import unescape
+    for day in (3, 1, 2):
+        db.session.add(Reminder(message='Reminder {}'.format(day), date=date(2023, 1, day), habit_id=habit_created.id))
+    db.session.commit()
+
+    messages, url = [], url_for('reminder.index', page_size=2)
+    while url:
+        page = test_client.get(url).get_data(as_text=True)
+        messages += re.findall(r'<strong>(Reminder \d)</strong>', page)
+        links = re.findall(r'href="([^"]*cursor=[^"]*)">Next page', page)
+        url = unescape(links[0]) if links else None
+    assert messages == ['Reminder 1', 'Reminder 2', 'Reminder 3']
+
+
+# Test case for the reminders due today on the landing page.
+def test_landing_page_reminders(test_client, user_with_login, habit_created):
+    from datetime import date
+    from sqlalchemy import event
+    other = User(username='other', email='other@example.com')
+    db.session.add(other)
+    db.session.commit()
+    other_habit = Habit(name='Other habit', periodicity='daily', user_id=other.id)
+    db.session.add(other_habit)
+    db.session.commit()
+    db.session.add_all([
+        Reminder(message='Mine today', date=date.today(), habit_id=habit_created.id),
+        Reminder(message='Mine later', date=date(2099, 1, 1), habit_id=habit_created.id),
+        Reminder(message='Theirs today', date=date.today(), habit_id=other_habit.id)
+    ])
+    db.session.commit()
+
+    # Logged-in users see only their own reminders of the day.
+    page = test_client.get(url_for('main.index')).get_data(as_text=True)
+    assert 'Mine today' in page
+    assert 'Mine later' not in page
+    assert 'Theirs today' not in page
+
+    # Anonymous visitors get the static landing page without any query.
+    test_client.get(url_for('auth.logout'))
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        responses = [test_client.get(url_for('main.index')) for _ in range(2)]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert statements == []
+    assert responses[0].data == responses[1].data
+    assert b'Register' in responses[0].data and b'Theirs today' not in responses[0].data
+    assert responses[0].cache_control.public
+    assert 'Cookie' in responses[0].vary
+
+
+# Test case for the reminder dispatcher.
+def test_dispatch_reminders(test_client, test_app, user_with_login, habit_created, tmp_path):
+    import asyncio
+    import json
+    from datetime import date, timedelta
+    from app.dispatcher import Dispatcher, LogFileSink, Sink
+    today = date.today()
+    for number in range(5):
+        db.session.add(Reminder(message='Due {}'.format(number), date=today, next_due=today,
+                                habit_id=habit_created.id))
+    for message, days in (('Yesterday', -1), ('Last week', -7), ('Tomorrow', 1)):
+        day = today + timedelta(days=days)
+        db.session.add(Reminder(message=message, date=day, next_due=day, habit_id=habit_created.id))
+    db.session.commit()
+
+    # Due reminders of today and yesterday are delivered in batches, each exactly once.
+    path = tmp_path / 'reminders.log'
+    dispatcher = Dispatcher(LogFileSink(str(path)), batch_size=2, report=lambda message: None)
+    asyncio.run(dispatcher.run(interval=0, once=True))
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['message'] for line in lines] == ['Yesterday', 'Due 0', 'Due 1', 'Due 2', 'Due 3', 'Due 4']
+    assert lines[0]['habit'] == 'Read a Book' and lines[0]['email'] == user_with_login[1]
+    assert Reminder.query.filter(Reminder.dispatched_at.is_(None)).count() == 2
+    metrics = dispatcher.metrics.snapshot()
+    assert metrics['dispatched'] == 6 and metrics['ticks'] == 4 and metrics['failed'] == 0
+    assert metrics['max_lag'] >= 24 * 60 * 60 and metrics['throughput'] > 0
+
+    result = test_app.test_cli_runner().invoke(args=['reminders', 'dispatch', '--target', str(path), '--once'])
+    assert 'Dispatched 0 reminders in 1 ticks' in result.output
+
+    # Sinks have to implement send.
+    with pytest.raises(TypeError):
+        Sink()
+
+    # Reminders whose delivery failed are retried by the next tick.
+    class FailingSink(Sink):
+        def send(self, reminder):
+            raise OSError('unreachable')
+
+    tomorrow = today + timedelta(days=1)
+    dispatcher = Dispatcher(FailingSink(), report=lambda message: None)
+    assert asyncio.run(dispatcher.tick(today=tomorrow)) == 0
+    assert dispatcher.metrics.failed == 1
+    assert Reminder.query.filter_by(message='Tomorrow').one().next_due == tomorrow
+    dispatcher = Dispatcher(LogFileSink(str(path)), report=lambda message: None)
+    assert asyncio.run(dispatcher.tick(today=tomorrow)) == 1
+
+
+# Test case for dispatching batches larger than the concurrency through a sink that yields, on several loops.
+def test_dispatch_concurrency(test_client, test_app, user_with_login, habit_created):
+    import asyncio
+    from datetime import date
+    from app.dispatcher import Dispatcher, Sink
+    today = date.today()
+    for number in range(6):
+        db.session.add(Reminder(message='Due {}'.format(number), date=today, next_due=today,
+                                habit_id=habit_created.id))
+    db.session.commit()
+
+    class YieldingSink(Sink):
+        def __init__(self):
+            self.delivered = []
+
+        async def deliver(self, reminder):
+            await asyncio.sleep(0)
+            self.delivered.append(reminder.message)
+
+        def send(self, reminder):
+            pass
+
+    sink = YieldingSink()
+    dispatcher = Dispatcher(sink, batch_size=3, concurrency=1, report=lambda message: None)
+    assert asyncio.run(dispatcher.tick()) == 3
+    assert asyncio.run(dispatcher.tick()) == 3
+    assert sorted(sink.delivered) == ['Due {}'.format(number) for number in range(6)]
+    assert Reminder.query.filter(Reminder.next_due.isnot(None)).count() == 0
+
+
+# Test case for recurring reminder rules.
+def test_recurring_reminders(test_client, test_app, user_with_login, habit_created):
+    import asyncio
+    from datetime import date, timedelta
+    from app.dispatcher import Dispatcher, Sink
+    from app.recurrence import occurrences
+    monday = date(2024, 1, 1)
+
+    # Rules expand lazily into any window, open-ended ones included.
+    assert list(occurrences(monday, 'daily', None, None, None, date(2024, 1, 30), date(2024, 2, 1))) == [
+        date(2024, 1, 30), date(2024, 1, 31), date(2024, 2, 1)]
+    weekly = occurrences(monday, 'weekly', 0b0001001, None, None, monday)
+    assert [next(weekly) for _ in range(3)] == [date(2024, 1, 1), date(2024, 1, 4), date(2024, 1, 8)]
+    assert list(occurrences(monday, 'interval', None, 3, date(2024, 1, 10), date(2024, 1, 2))) == [
+        date(2024, 1, 4), date(2024, 1, 7), date(2024, 1, 10)]
+    assert list(occurrences(monday, None, None, None, None, monday, date(2024, 12, 31))) == [monday]
+
+    # Rules are added through the form and stored once.
+    today = date.today()
+    weekdays = [str(today.weekday()), str((today.weekday() + 1) % 7)]
+    forms = [
+        {'recurrence': 'daily', 'message': 'Every day'},
+        {'recurrence': 'weekly', 'weekday': weekdays, 'message': 'Two days a week'},
+        {'recurrence': 'weekly', 'weekday': [str((today.weekday() + 2) % 7)], 'message': 'Other weekday'},
+        {'recurrence': 'interval', 'interval_days': '2', 'message': 'Every other day'},
+        {'recurrence': 'daily', 'until': (today - timedelta(days=1)).isoformat(), 'message': 'Ended'},
+    ]
+    start = (today - timedelta(days=20)).isoformat()
+    for form in forms:
+        form.update(habit_id=habit_created.id, date=start)
+        test_client.post(url_for('reminder.add_reminder'), data=form)
+    assert Reminder.query.count() == 5
+    response = test_client.post(url_for('reminder.add_reminder'), data={
+        'habit_id': habit_created.id, 'date': start, 'message': 'No weekday', 'recurrence': 'weekly'},
+        follow_redirects=True)
+    assert 'Please select at least one weekday.' in response.get_data(as_text=True)
+    assert Reminder.query.count() == 5
+
+    # The landing page shows the rules occurring today, the index lists the rules.
+    page = test_client.get(url_for('main.index')).get_data(as_text=True)
+    assert 'Every day' in page and 'Two days a week' in page and 'Every other day' in page
+    assert 'Other weekday' not in page and 'Ended' not in page
+    page = test_client.get(url_for('reminder.index')).get_data(as_text=True)
+    assert 'Every 2 days from {}'.format(start) in page
+    assert 'Next: {}'.format(today.isoformat()) in page
+
+    # The dispatcher delivers today's occurrences and advances every rule to its next occurrence.
+    class NullSink(Sink):
+        def send(self, reminder):
+            pass
+
+    dispatcher = Dispatcher(NullSink(), report=lambda message: None)
+    assert asyncio.run(dispatcher.tick()) == 3
+    assert asyncio.run(dispatcher.tick()) == 0
+    daily = Reminder.query.filter_by(message='Every day').one()
+    assert daily.next_due == today + timedelta(days=1)
+    assert Reminder.query.filter_by(message='Every other day').one().next_due == today + timedelta(days=2)
+    assert Reminder.query.filter_by(message='Ended').one().next_due is None
+
+    # Editing a rule continues after the occurrence delivered today.
+    test_client.post(url_for('reminder.edit_reminder', reminder_id=daily.id), data={
+        'date': start, 'message': 'Every fourth day', 'recurrence': 'interval', 'interval_days': '4'})
+    daily = db.session.get(Reminder, daily.id)
+    assert daily.schedule == 'Every 4 days from {}'.format(start)
+    assert daily.next_due == today + timedelta(days=4)
+    assert test_client.get(url_for('reminder.edit_reminder', reminder_id=daily.id)).status_code == 200
+
+
 # Test case for adding a reminder.
 def test_add_reminder(test_client, user_with_login, habit_created):
     response = test_client.post(url_for('reminder.add_reminder'), data={